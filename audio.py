@@ -0,0 +1,152 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pygame
+
+CACHE_DIR = ".sample_cache"
+
+
+class SampleBank:
+    """
+    音源ファイルをミキサーの形式(周波数・ビット数・チャンネル数)のPCMに一度だけデコードし、
+    ディスクにキャッシュしておくクラス
+    次回からはキャッシュをメモリマップで読み込むので、MP3のデコードが要らない
+    ヒット時はロード済みのSoundを返すだけで、ファイルの読み込みは行わない
+
+    pygame.mixer.init()の後に作ること
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.sounds = {}
+        init = pygame.mixer.get_init()
+        if init is None:
+            raise RuntimeError("pygame.mixer is not initialized")
+        self.frequency, self.size, self.channels = init
+
+    def _cache_path(self, path):
+        # ファイルの中身とミキサーの形式からキャッシュのファイル名を決める
+        with open(path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        name = f"{digest}_{self.frequency}_{self.size}_{self.channels}.npy"
+        return os.path.join(self.cache_dir, name)
+
+    def _decode(self, path, cache_path):
+        pcm = np.frombuffer(pygame.mixer.Sound(path).get_raw(), dtype=np.uint8)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 書き込み途中のファイルを読まないように、書き終えてから名前を変える
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, pcm)
+        os.replace(tmp_path, cache_path)
+
+    def load(self, path):
+        """
+        音源を読み込んで再生可能なSoundを返す関数 (同じファイルは一度しか読み込まない)
+        """
+        sound = self.sounds.get(path)
+        if sound is None:
+            cache_path = self._cache_path(path)
+            if not os.path.exists(cache_path):
+                self._decode(path, cache_path)
+            pcm = np.load(cache_path, mmap_mode="r")
+            sound = pygame.mixer.Sound(buffer=memoryview(pcm))
+            self.sounds[path] = sound
+        return sound
+
+    def __getitem__(self, path):
+        return self.load(path)
+
+
+class VoicePool:
+    """
+    トラックごとにミキサーのチャンネルを予約しておき、決まった数の音(ボイス)だけを同時に鳴らすクラス
+    空きが無いときは一番古く鳴り始めたボイスを止めて使い回す (steal=Falseなら鳴らさずに捨てる)
+    シーケンサのスレッドとゲームループの両方から鳴らせるように、チャンネルの選択はロックして行う
+
+    polyphony: {"hihat": 4, "snare": 4, "kick": 4} のようなトラックごとの同時発音数
+    pygame.mixer.init()の後に作ること
+    """
+
+    def __init__(self, polyphony, steal=True, clock=time.monotonic):
+        self.steal = steal
+        self.clock = clock
+        total = sum(polyphony.values())
+        if pygame.mixer.get_num_channels() < total:
+            pygame.mixer.set_num_channels(total)
+        # 先頭のチャンネルはSound.play()の自動割り当てに使われないようにする
+        pygame.mixer.set_reserved(total)
+
+        self.channels = {}
+        self.started = {}  # トラックごとの各チャンネルの鳴り始めた時刻
+        start = 0
+        for track, count in polyphony.items():
+            self.channels[track] = [pygame.mixer.Channel(i) for i in range(start, start + count)]
+            self.started[track] = [0.0] * count
+            start += count
+        self.played = dict.fromkeys(polyphony, 0)
+        self.stolen = dict.fromkeys(polyphony, 0)
+        self.dropped = dict.fromkeys(polyphony, 0)
+        self.lock = threading.Lock()
+
+    def play(self, track, sound):
+        channels = self.channels[track]
+        started = self.started[track]
+        with self.lock:
+            index = next((i for i, channel in enumerate(channels) if not channel.get_busy()), None)
+            if index is None:
+                if not self.steal or not channels:
+                    self.dropped[track] += 1
+                    return None
+                # 一番古いボイスを止めて使う
+                index = min(range(len(channels)), key=started.__getitem__)
+                channels[index].stop()
+                self.stolen[track] += 1
+            channels[index].play(sound)
+            started[index] = self.clock()
+            self.played[track] += 1
+            return channels[index]
+
+    def busy(self):
+        """
+        今鳴っているボイスの数を返す関数
+        """
+        return sum(channel.get_busy() for channels in self.channels.values() for channel in channels)
+
+    def voice(self, track, sound):
+        """
+        play()で呼ぶとこのトラックのボイスで鳴るオブジェクトを返す関数
+        """
+        return Voice(self, track, sound)
+
+    def stats(self):
+        return {track: {"played": self.played[track], "stolen": self.stolen[track], "dropped": self.dropped[track]}
+                for track in self.channels}
+
+
+class Voice:
+    """
+    VoicePoolの決まったトラックで音を鳴らすためのオブジェクト (Soundの代わりに使える)
+    """
+
+    def __init__(self, pool, track, sound):
+        self.pool = pool
+        self.track = track
+        self.sound = sound
+
+    def play(self):
+        return self.pool.play(self.track, self.sound)
+
+
+def fade_out(channel, sound, fade_ms=30):
+    """
+    channelでまだsoundが鳴っていればフェードアウトして止める関数
+    (他の音に使い回されたチャンネルは止めない)
+    channel: Sound.play()やVoicePool.play()の戻り値 (Noneなら何もしない)
+    """
+    sound = getattr(sound, "sound", sound)  # Voiceなら中のSound
+    if channel is not None and channel.get_busy() and channel.get_sound() is sound:
+        channel.fadeout(fade_ms)
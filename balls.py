@@ -0,0 +1,131 @@
+import heapq
+import math
+import random
+
+import cv2
+import numpy as np
+
+
+def random_velocity(speed):
+    """
+    玉の初期ベクトルをランダムに決定する関数 (8方向)
+    """
+    x_speed, y_speed = 0, 0
+    while x_speed == 0 and y_speed == 0:
+        x_speed = random.choice([-speed, 0, speed])
+        y_speed = random.choice([-speed, 0, speed])
+    if x_speed == 0 or y_speed == 0: # 調整
+        x_speed = x_speed * math.sqrt(2)
+        y_speed = y_speed * math.sqrt(2)
+    return x_speed, y_speed
+
+
+class BallStore:
+    """
+    全トラックの玉をNumPyの配列(出した位置と時刻、速度、トラック番号、生存フラグ)でまとめて管理するクラス
+    玉は中心から等速で直線に進むので、出した時点でリングを通過する時刻と画面外に出る時刻が決まる
+    その時刻を優先度付きキューに入れておき、時刻になった玉だけを取り出して得点に数えたり削除したりする
+    音はゲームループでは鳴らさず、シーケンサのスレッドがリングに着く時刻(arrival_time)ちょうどに鳴らす
+
+    colors: トラックごとの玉の色
+    radius: 音を鳴らすリングの半径 (玉を出した位置からの距離)
+    bounds: 画面の(幅, 高さ) (外に出た玉は削除する、Noneなら削除しない)
+    """
+
+    CROSSING = 0
+    EXPIRY = 1
+
+    def __init__(self, colors, radius, bounds=None, capacity=64, size=20):
+        self.colors = list(colors)
+        self.radius = radius
+        self.bounds = bounds
+        self.size = size
+        self.x = np.zeros(capacity, dtype=np.float64)  # 現在の位置
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.x0 = np.zeros(capacity, dtype=np.float64)  # 出した位置
+        self.y0 = np.zeros(capacity, dtype=np.float64)
+        self.t0 = np.zeros(capacity, dtype=np.float64)  # 出した時刻
+        self.vx = np.zeros(capacity, dtype=np.float64)
+        self.vy = np.zeros(capacity, dtype=np.float64)
+        self.track = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.generation = np.zeros(capacity, dtype=np.int64)  # 番号を使い回した回数 (古い予定を無視するため)
+        self.schedule = []  # (時刻, 種類, 玉の番号, generation) の優先度付きキュー
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        for name in ["x", "y", "x0", "y0", "t0", "vx", "vy", "track", "alive", "generation"]:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def spawn(self, track, position, speed, time=0.0):
+        """
+        時刻timeにpositionから玉を出し、リングを通過する時刻と画面外に出る時刻を予定に入れる関数
+        """
+        free = np.flatnonzero(~self.alive)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.alive)
+        i = int(free[0])
+        x, y = position
+        vx, vy = random_velocity(speed)
+        self.x[i], self.y[i] = x, y
+        self.x0[i], self.y0[i] = x, y
+        self.t0[i] = time
+        self.vx[i], self.vy[i] = vx, vy
+        self.track[i] = track
+        self.alive[i] = True
+        self.generation[i] += 1
+        generation = int(self.generation[i])
+
+        heapq.heappush(self.schedule, (time + self.radius / math.hypot(vx, vy), self.CROSSING, i, generation))
+        if self.bounds is not None:
+            width, height = self.bounds
+            # x < 0 または x >= width になったら画面外
+            times = [_exit_time(x, vx, width), _exit_time(y, vy, height)]
+            heapq.heappush(self.schedule, (time + min(times), self.EXPIRY, i, generation))
+        return i
+
+    def advance(self, now):
+        """
+        時刻nowまでに予定された通過と削除を時刻順に処理し、玉の位置をnowの位置にする関数
+        戻り値: (リングを通過した玉の番号の配列, 通過した時刻の配列)
+        """
+        crossed = []
+        times = []
+        while self.schedule and self.schedule[0][0] <= now:
+            time, kind, i, generation = heapq.heappop(self.schedule)
+            if not self.alive[i] or self.generation[i] != generation:
+                continue
+            if kind == self.CROSSING:
+                crossed.append(i)
+                times.append(time)
+            else:
+                self.alive[i] = False
+        alive = self.alive
+        elapsed = now - self.t0[alive]
+        self.x[alive] = self.x0[alive] + self.vx[alive] * elapsed
+        self.y[alive] = self.y0[alive] + self.vy[alive] * elapsed
+        return np.array(crossed, dtype=np.intp), np.array(times, dtype=np.float64)
+
+    def draw(self, frame):
+        # トラックの順(hihat, snare, kick)に重ねて描画する
+        indices = np.flatnonzero(self.alive)
+        for i in indices[np.argsort(self.track[indices], kind="stable")]:
+            cv2.circle(frame, (int(self.x[i]), int(self.y[i])), self.size, self.colors[self.track[i]], -1)
+
+
+def _exit_time(position, velocity, size):
+    """
+    0 <= position < size の範囲から出るまでの時間を返す関数 (動いていなければ無限大)
+    """
+    if velocity > 0:
+        return (size - position) / velocity
+    if velocity < 0:
+        return position / -velocity
+    return math.inf
@@ -1,34 +1,36 @@
 import cv2
 import mediapipe as mp
 import pygame
-import math
-import numpy as np
-
-def calculate_angle(a, b, c):
-    """
-    3点の座標を使用して角度を計算する関数
-    """
-    angle_rad = math.atan2(c.y - b.y, c.x - b.x) - math.atan2(a.y - b.y, a.x - b.x)
-    angle_deg = math.degrees(angle_rad)
-    return angle_deg
+from audio import SampleBank
+from gestures import Gesture, GestureEngine
+from inference import landmarks_to_array
+from tracking import create_tracker
 
 # MediapipeのPoseモジュールを初期化
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
+# このゲームで使うランドマーク (肩・肘・手首だけなので姿勢のモデルだけを動かす)
+required_landmarks = {"pose"}
+model_complexity = 1  # 0(軽い), 1, 2(精度が高い)
+
+# 関節の角度で音を鳴らすジェスチャー
+# 肘を90度より曲げたら鳴らし、100度より伸ばしたら次に曲げたときにまた鳴らす
+gestures = [
+    Gesture("hihat", "left_elbow", enter=90, exit=100),
+    Gesture("snare", "right_elbow", enter=90, exit=100),
+]
+# ジェスチャーごとの音源ファイルと、鳴らしたときに表示する位置
+gesture_sounds = {"hihat": "hihat.mp3", "snare": "snare.mp3"}
+gesture_text_positions = {"hihat": (20, 50), "snare": (20, 100)}
+
 # Webカメラから映像を取得
 cap = cv2.VideoCapture(0)
 
 # Pygameを初期化して音声を再生するための準備
 pygame.mixer.init()
-
-# 音源の再生状態を管理するフラグ
-is_snare_playing = False
-is_hihat_playing = False
-
-# 音源再生フラグを管理する変数
-snare_played = False
-hihat_played = False
+samples = SampleBank()
+sounds = [samples.load(gesture_sounds[gesture.name]) for gesture in gestures]
 
 # ウィンドウの表示用フォント
 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -37,7 +39,10 @@ font = cv2.FONT_HERSHEY_SIMPLEX
 width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-with mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
+engine = GestureEngine(gestures)
+
+with create_tracker(required_landmarks, model_complexity=model_complexity,
+                    min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
     while cap.isOpened():
         ret, frame = cap.read()
 
@@ -54,49 +59,13 @@ with mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7) as
         image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         mp_drawing.draw_landmarks(image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
 
-        # 左腕の角度を取得
-        if results.pose_landmarks is not None:
-            left_shoulder = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            left_elbow = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_ELBOW]
-            left_wrist = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_WRIST]
-            angle = calculate_angle(left_shoulder, left_elbow, left_wrist)
-
-            # 左腕が曲げられたらhihatを再生
-            if angle < 90:
-                # hihatが再生中でない場合に再生開始
-                if not is_hihat_playing and not hihat_played:
-                    pygame.mixer.music.load('hihat.mp3')
-                    pygame.mixer.music.play()
-                    is_hihat_playing = True
-                    is_snare_playing = False
-                    hihat_played = True
-                    cv2.putText(image, 'hihat.mp3', (20, 50), font, 1, (0, 255, 0), 2)
-            else:
-                # 左腕が曲げられていない場合は再生中フラグをリセット
-                is_hihat_playing = False
-                hihat_played = False
-
-        # 右腕の角度を取得
+        # 全ての関節の角度からジェスチャーを判定し、始まったジェスチャーの音を鳴らす
         if results.pose_landmarks is not None:
-            right_shoulder = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            right_elbow = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_ELBOW]
-            right_wrist = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_WRIST]
-            angle = calculate_angle(right_shoulder, right_elbow, right_wrist)
-
-            # 右腕が曲げられたらsnareを再生
-            if angle < 90:
-                # snareが再生中でない場合に再生開始
-                if not is_snare_playing and not snare_played:
-                    pygame.mixer.music.load('snare.mp3')
-                    pygame.mixer.music.play()
-                    is_snare_playing = True
-                    is_hihat_playing = False
-                    snare_played = True
-                    cv2.putText(image, 'snare.mp3', (20, 100), font, 1, (0, 255, 0), 2)
-            else:
-                # 右腕が曲げられていない場合は再生中フラグをリセット
-                is_snare_playing = False
-                snare_played = False
+            points = landmarks_to_array(results.pose_landmarks)  # (33, 4) x, y, z, visibility
+            for i in engine.update(points, points[:, 3], (width, height)):
+                sounds[i].play()
+                name = engine.names[i]
+                cv2.putText(image, gesture_sounds[name], gesture_text_positions[name], font, 1, (0, 255, 0), 2)
 
         # ウィンドウに映像を表示
         # cv2.circle(image, (width // 2, height // 2), 50, (255, 0, 0), -1)  # 水色の円を描画
@@ -3,6 +3,8 @@ import mediapipe as mp
 import pygame
 import random
 import time
+from audio import SampleBank
+from tracking import create_tracker
 
 # Webカメラから映像を取得
 cap = cv2.VideoCapture(0)
@@ -11,8 +13,14 @@ cap = cv2.VideoCapture(0)
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
+# このゲームで使うランドマーク (骨格を描画するだけなので姿勢のモデルだけを動かす)
+required_landmarks = {"pose"}
+model_complexity = 1  # 0(軽い), 1, 2(精度が高い)
+
 # Pygameを初期化して音声を再生するための準備
 pygame.mixer.init()
+# 音源はデコード済みのものをキャッシュから読み込んでおく
+samples = SampleBank()
 
 # 音源の再生状態を管理するフラグ
 is_snare_playing = False
@@ -54,8 +62,7 @@ class Ball:
 
     def play_sound(self):
         if self.sound_file is not None:
-            pygame.mixer.music.load(self.sound_file)
-            pygame.mixer.music.play()
+            samples[self.sound_file].play()
 
     def remove(self):
         # 適当な位置に移動して非表示にする
@@ -76,9 +83,12 @@ kick = []
 hihat_sound_file = "hihat.mp3"
 snare_sound_file = "snare.mp3"
 kick_sound_file = "kick.mp3"
+for sound_file in [hihat_sound_file, snare_sound_file, kick_sound_file]:
+    samples.load(sound_file)
 
 counter = 0
-with mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
+with create_tracker(required_landmarks, model_complexity=model_complexity,
+                    min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
     start_time = time.time()
     while cap.isOpened():
         current_time = time.time()
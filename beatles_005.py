@@ -5,6 +5,8 @@ import random
 import time
 import numpy as np
 import math
+from audio import SampleBank
+from tracking import create_tracker
 
 # Webカメラから映像を取得
 cap = cv2.VideoCapture(0)
@@ -13,8 +15,14 @@ cap = cv2.VideoCapture(0)
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
+# このゲームで使うランドマーク (骨格を描画するだけなので姿勢のモデルだけを動かす)
+required_landmarks = {"pose"}
+model_complexity = 1  # 0(軽い), 1, 2(精度が高い)
+
 # Pygameを初期化して音声を再生するための準備
 pygame.mixer.init()
+# 音源はデコード済みのものをキャッシュから読み込んでおく
+samples = SampleBank()
 
 # ウィンドウの表示用フォント
 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -68,12 +76,13 @@ snare = []
 kick = []
 
 # 音源ファイルのパス
-hihat_sound_file = pygame.mixer.Sound("hihat.mp3")
-snare_sound_file = pygame.mixer.Sound("snare.mp3")
-kick_sound_file = pygame.mixer.Sound("kick.mp3")
+hihat_sound_file = samples.load("hihat.mp3")
+snare_sound_file = samples.load("snare.mp3")
+kick_sound_file = samples.load("kick.mp3")
 
 counter = 0
-with mp_pose.Pose(min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
+with create_tracker(required_landmarks, model_complexity=model_complexity,
+                    min_detection_confidence=0.7, min_tracking_confidence=0.7) as pose:
     start_time = time.time()
     while cap.isOpened():
         current_time = time.time()
@@ -1,15 +1,19 @@
 import cv2
 import mediapipe as mp
+from tracking import create_tracker
 
 # Mediapipeの初期化
 mp_drawing = mp.solutions.drawing_utils
-mp_holistic = mp.solutions.holistic
+
+# このゲームで使うランドマーク (顔は使わないので姿勢と手のモデルだけを動かす)
+required_landmarks = {"pose", "left_hand", "right_hand"}
 
 # ウェブカメラのキャプチャ
 cap = cv2.VideoCapture(0)
 
 # Mediapipeのモデルを初期化
-holistic = mp_holistic.Holistic(
+holistic = create_tracker(
+    required_landmarks,
     static_image_mode=False,
     min_detection_confidence=0.5,
     min_tracking_confidence=0.5
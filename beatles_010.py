@@ -5,10 +5,14 @@ import random
 import time
 import numpy as np
 import math
+from audio import SampleBank
+from tracking import create_tracker
 
 # Mediapipeの初期化
 mp_drawing = mp.solutions.drawing_utils
-mp_holistic = mp.solutions.holistic
+
+# このゲームで使うランドマーク (顔は使わないので姿勢と手のモデルだけを動かす)
+required_landmarks = {"pose", "left_hand", "right_hand"}
 
 # ウェブカメラのキャプチャ
 cap = cv2.VideoCapture(0)
@@ -17,6 +21,8 @@ cap.set(cv2.CAP_PROP_FPS, frame_rate)
 
 # Pygameを初期化して音声を再生するための準備
 pygame.mixer.init()
+# 音源はデコード済みのものをキャッシュから読み込んでおく
+samples = SampleBank()
 
 # ウィンドウの表示用フォント
 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -70,14 +76,15 @@ snare = []
 kick = []
 
 # 音源ファイルのパス
-hihat_sound_file = pygame.mixer.Sound("hihat.mp3")
-snare_sound_file = pygame.mixer.Sound("snare.mp3")
-kick_sound_file = pygame.mixer.Sound("kick.mp3")
+hihat_sound_file = samples.load("hihat.mp3")
+snare_sound_file = samples.load("snare.mp3")
+kick_sound_file = samples.load("kick.mp3")
 
 counter = 0
 window_name = "window"
 # Mediapipeのモデルを初期化
-holistic = mp_holistic.Holistic(
+holistic = create_tracker(
+    required_landmarks,
     static_image_mode=False,
     min_detection_confidence=0.5,
     min_tracking_confidence=0.5
@@ -1,225 +1,514 @@
+import functools
+import math
+from collections import deque
 import cv2
 import mediapipe as mp
 import pygame
+import os
+import queue
 import random
+import sys
 import time
 import numpy as np
-import math
+from audio import SampleBank, VoicePool, fade_out
+from balls import BallStore
+from capture import MultiCapture, ThreadedCapture
+from inference import EMPTY_RESULTS, InferencePool, InferenceWorker, RoiModel
+from landmarks import LandmarkExtractor
+from patterns import compile_midi, compile_pattern
+from players import MultiPlayerModel, Scoreboard, split_results
+from prediction import PredictiveTrigger
+from replay import LandmarkRecorder
+from ring import RingCompositor, RingIndex, segment_position
+from sequencer import StepSequencer
+from smoothing import OneEuroFilter
+from timing import LatencyTracker, StageTimer
+from tracking import create_tracker
 
 # Mediapipeの初期化
 mp_drawing = mp.solutions.drawing_utils
-mp_holistic = mp.solutions.holistic
 
-# ウェブカメラのキャプチャ
-cap = cv2.VideoCapture(0)
+# このゲームで使うランドマーク (顔は使わないのでHolisticではなく姿勢と手のモデルだけを動かす)
+required_landmarks = {"pose", "left_hand", "right_hand"}
+model_complexity = 1  # 0(軽い), 1, 2(精度が高い)
+
 frame_rate = 30
-cap.set(cv2.CAP_PROP_FPS, frame_rate)
 
-# Pygameを初期化して音声を再生するための準備
-pygame.mixer.init()
+# 使うカメラの番号 (動画ファイルのパスも使える)
+# 複数指定すると同じ時刻に撮ったフレームを左から並べて一つの広いステージにする
+# 例: [0, 1] (横に並べた2台で広いステージ)、[0, 2] (足元を低い位置の横のカメラで撮る)
+camera_sources = [0]
 
 # ウィンドウの表示用フォント
 font = cv2.FONT_HERSHEY_SIMPLEX
 
-width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-center = (width // 2, height // 2)  # 画像の中心座標
-
-class Ball:
-    def __init__(self, speed, color, sound=None):
-        # 初期位置を決定(画面の中心)
-        self.speed = speed
-        self.x, self.y = width // 2, height // 2
-        self.x_speed = 0
-        self.y_speed = 0
-        # 玉の初期ベクトルをランダムに決定
-        while self.x_speed == 0 and self.y_speed == 0:
-            self.x_speed = random.choice([-self.speed, 0, self.speed])
-            self.y_speed = random.choice([-self.speed, 0, self.speed])
-        if self.x_speed == 0 or self.y_speed == 0: # 調整
-            self.x_speed = self.x_speed * math.sqrt(2)
-            self.y_speed = self.y_speed * math.sqrt(2)
-        # BGR
-        # 水色, 黄緑, オレンジ
-        self.color = color
-        self.size = 20
-        self.sound = sound
-        self.isAudioPlayed = False
-
-    def move(self):
-        self.x += self.x_speed
-        self.y += self.y_speed
-
-    def draw(self, frame):
-        cv2.circle(frame, (int(self.x), int(self.y)), self.size, self.color, -1)
-
-    def play_sound(self):
-        if self.sound is not None and not self.isAudioPlayed:
-            self.sound.play()
-            self.isAudioPlayed = True
+radius = 200  # 円の半径
+thickness = 50  # 円の線の太さ
 
 BPM = 60
 hihat_beats = [1, 1, 1, 1, 1, 1, 1, 1]
 snare_beats = [0, 0, 1, 0, 0, 0, 1, 0]
 kick_beats = [1, 0, 0, 0, 1, 1, 0, 0]
 
-ball_speed = 3
+ball_speed = 90  # 1秒あたりに玉が進むピクセル数
 interval = 60 / BPM # 秒数ごとにBallを作成する間隔
-hihat = []
-snare = []
-kick = []
 
 # 音源ファイルのパス
-hihat_sound_file = pygame.mixer.Sound("hihat.mp3")
-snare_sound_file = pygame.mixer.Sound("snare.mp3")
-kick_sound_file = pygame.mixer.Sound("kick.mp3")
+hihat_sound_file = "hihat.mp3"
+snare_sound_file = "snare.mp3"
+kick_sound_file = "kick.mp3"
+
+# トラックの並び (玉の番号はこの順)
+# BGR
+# 水色, 黄緑, オレンジ
+track_names = ["hihat", "snare", "kick"]
+track_colors = [(193, 185, 90), (98, 193, 90), (90, 124, 193)]
+# トラックごとに同時に鳴らせる音の数
+polyphony = {"hihat": 4, "snare": 4, "kick": 4}
+
+# リングに当てる体の部位と、その丸の色
+tracked_groups = ["left_hand", "right_hand", "left_foot", "right_foot"]
+tracked_colors = [(0, 200, 0), (0, 0, 255), (255, 0, 0), (255, 255, 0)]
+
+# 体の部位の位置のぶれを抑えるフィルタの設定 (One Euroフィルタ)
+smoothing_min_cutoff = 1.0  # 止まっているときのカットオフ周波数(Hz)、小さいほどぶれが減る
+smoothing_beta = 0.02  # 速く動かしたときに遅れを減らす係数 (速さはピクセル/秒)
+
+# 体の部位がリングのセグメントに当たったときに鳴らすトラックの番号 (セグメント番号順、Noneなら鳴らさない)
+# 例: [0, 1, 2] * 5 + [0]
+segment_tracks = None
+# セグメントの当たりを先取りする時間(秒)、0なら先取りしない
+# latency.pyで計測したcapture->landmarksとlandmarks->hitの合計に合わせる
+prediction_horizon = 0.08
+# 先取りした音が外れだったときにフェードアウトする時間(ミリ秒)
+cancel_fade_ms = 30
+
+# 一緒に遊ぶ人数 (2人以上なら画面を横に等分したレーンに1人ずつ立つ)
+players = 1
+# 得点の表示色 (プレイヤーごと)
+player_colors = [(255, 255, 255), (255, 255, 0), (0, 255, 255), (255, 0, 255)]
 
-counter = 0
 window_name = "window"
-# Mediapipeのモデルを初期化
-holistic = mp_holistic.Holistic(
-    static_image_mode=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
-
-cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-cv2.resizeWindow(window_name, 800, 600)
-
-
-left_hand_center_x, right_hand_center_x, left_foot_center_x, right_foot_center_x = 0, 0, 0, 0
-left_hand_center_y, right_hand_center_y, left_foot_center_y, right_foot_center_y = 0, 0, 0, 0
-
-def calculate_point_condition(x, y, center, radius, thickness):
-    angle = 2 * math.pi - math.atan2(y - center[1], x - center[0])
-    distance = math.sqrt((x - center[0])**2 + (y - center[1])**2)
-    check_point_condition = radius - thickness <= distance <= radius + thickness
-    return check_point_condition, angle
-
-def decide_color_and_draw_ellipse(check_point_condition, angle, angle_start, angle_end, center, radius, thickness, overlay):
-    check_angle_condition = angle_start <= angle <= angle_end
-    if check_point_condition and check_angle_condition:
-        color = (200, 0, 0)
-    else:
-        color = (0, 0, 200)
-    cv2.ellipse(overlay, center, (radius, radius), 0, int(angle_start * 180 / np.pi), int(angle_end * 180 / np.pi), color, thickness)
-
-
-# キャプチャの開始
-start_time = time.time()
-while cap.isOpened():
-    x_point_array = [left_hand_center_x, right_hand_center_x, left_foot_center_x, right_foot_center_x]
-    y_point_array = [left_hand_center_y, right_hand_center_y, left_foot_center_y, right_foot_center_y]
-    for x, y in zip(x_point_array, y_point_array):
-        x = center[0]
-        y = center[1]
-
-    current_time = time.time()
-    elapsed_time = current_time - start_time
-
-    if elapsed_time >= interval:
-        if hihat_beats[counter % 8]:
-            hihat.append(Ball(ball_speed, (193, 185, 90), hihat_sound_file))
-        if snare_beats[counter % 8]:
-            snare.append(Ball(ball_speed, (98, 193, 90), snare_sound_file))
-        if kick_beats[counter % 8]:
-            kick.append(Ball(ball_speed, (90, 124, 193), kick_sound_file))
-        start_time = current_time
-        counter += 1
-
-    for drum_part in [hihat, snare, kick]:
-        for ball in drum_part:
-            ball.move()
-            # 透明な円の部分を通過した場合に音源を再生
-            distance = int(math.sqrt((ball.x - center[0])**2 + (ball.y - center[1])**2))
-            if radius <= distance < radius + thickness:
-                ball.play_sound()
-
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # 映像を反転させる
-    frame = cv2.flip(frame, 1)
-
-    # フレームをRGBに変換
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    frame.flags.writeable = False
-
-    # Mediapipeで手と姿勢を検出
-    results = holistic.process(frame)
-
-    # 手と姿勢の座標を取得
-    left_hand_landmarks = results.left_hand_landmarks
-    right_hand_landmarks = results.right_hand_landmarks
-    pose_landmarks = results.pose_landmarks
-
-    thickness = 10
-    # 手の検出がある場合、左手の丸を描画
-    if left_hand_landmarks:
-        left_hand_x = [landmark.x for landmark in left_hand_landmarks.landmark]
-        left_hand_y = [landmark.y for landmark in left_hand_landmarks.landmark]
-        left_hand_center_x = int(sum(left_hand_x) / len(left_hand_x) * frame.shape[1])
-        left_hand_center_y = int(sum(left_hand_y) / len(left_hand_y) * frame.shape[0])
-        cv2.circle(frame, (left_hand_center_x, left_hand_center_y), 30, (0, 200, 0), thickness)
-
-    # 手の検出がある場合、右手の丸を描画
-    if right_hand_landmarks:
-        right_hand_x = [landmark.x for landmark in right_hand_landmarks.landmark]
-        right_hand_y = [landmark.y for landmark in right_hand_landmarks.landmark]
-        right_hand_center_x = int(sum(right_hand_x) / len(right_hand_x) * frame.shape[1])
-        right_hand_center_y = int(sum(right_hand_y) / len(right_hand_y) * frame.shape[0])
-        cv2.circle(frame, (right_hand_center_x, right_hand_center_y), 30, (0, 0, 255), thickness)
-
-    # 足の検出がある場合、左足の丸を描画
-    if pose_landmarks:
-        left_foot_x = [pose_landmarks.landmark[27].x, pose_landmarks.landmark[29].x, pose_landmarks.landmark[31].x]
-        left_foot_y = [pose_landmarks.landmark[27].y, pose_landmarks.landmark[29].y, pose_landmarks.landmark[31].y]
-        left_foot_center_x = int(sum(left_foot_x) / len(left_foot_x) * frame.shape[1])
-        left_foot_center_y = int(sum(left_foot_y) / len(left_foot_y) * frame.shape[0])
-        cv2.circle(frame, (left_foot_center_x, left_foot_center_y), 30, (255, 0, 0), thickness)
-
-    # 足の検出がある場合、右足の丸を描画
-    if pose_landmarks:
-        right_foot_x = [pose_landmarks.landmark[28].x, pose_landmarks.landmark[30].x, pose_landmarks.landmark[32].x]
-        right_foot_y = [pose_landmarks.landmark[28].y, pose_landmarks.landmark[30].y, pose_landmarks.landmark[32].y]
-        right_foot_center_x = int(sum(right_foot_x) / len(right_foot_x) * frame.shape[1])
-        right_foot_center_y = int(sum(right_foot_y) / len(right_foot_y) * frame.shape[0])
-        cv2.circle(frame, (right_foot_center_x, right_foot_center_y), 30, (255, 255, 0), thickness)
-
-    # 円を描画
-    radius = 200  # 円の半径
-    thickness = 50  # 円の線の太さ
-    # 玉を描画
-    for drum_part in [hihat, snare, kick]:
-        for ball in drum_part:
-            ball.draw(frame)
-
-    for i in range(16):
-        angle_start = i * np.pi / 8 + np.pi / 16  # 開始角度
-        angle_end = (i + 1) * np.pi / 8 + np.pi / 16  # 終了角度
-
-        overlay = frame.copy()
-        # Create a list with all coordinates
-        points = [(x, y) for x, y in zip(x_point_array, y_point_array)]
-
-        for point in points:
-            check_point_condition, angle = calculate_point_condition(point[0], point[1], center, radius, thickness)
-            decide_color_and_draw_ellipse(check_point_condition, angle, angle_start, angle_end, center, radius, thickness, overlay)
-
-        alpha = 0.5
-        frame = cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0)
-
-    # 画面外に消えた要素を削除
-    hihat = [ball for ball in hihat if 0 <= ball.x < width and 0 <= ball.y < height]
-    snare = [ball for ball in snare if 0 <= ball.x < width and 0 <= ball.y < height]
-    kick = [ball for ball in kick if 0 <= ball.x < width and 0 <= ball.y < height]
-
-    # フレームを表示
-    cv2.imshow(window_name, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
 
-# リソースの解放
-cap.release()
-cv2.destroyAllWindows()
+# 推論を別プロセスで行う場合のパイプラインの深さ (0なら同じスレッドで推論する)
+pipeline_depth = 2
+
+# 前のフレームで検出した体の周りだけを縮小して推論する (0ならフレーム全体をそのまま推論する)
+# 人が映った映像でbench.pyの精度と速さを確かめてから有効にする (例: 256)
+roi_size = 0
+
+# fpsや処理ごとの時間を画面の左上に表示する (調整用)
+show_hud = False
+# HUDに表示する処理と、その表示名
+hud_stages = [("capture", "capture"), ("inference", "inference"), ("balls", "physics"), ("hit", "hit"),
+              ("draw", "draw"), ("display", "display")]
+# 終了時に計測結果を書き出すファイル (.jsonか.csv、Noneなら書き出さない) 例: "metrics.json"
+metrics_file = None
+# セッションごとのランドマークを記録するディレクトリ (Noneなら記録しない、再生はreplay.py)
+# 例: "recordings" (ファイルは自動では消えないので、必要なときだけ設定する)
+record_dir = None
+
+
+def create_landmark_model():
+    # Mediapipeのモデルを初期化
+    return create_tracker(
+        required_landmarks,
+        model_complexity=model_complexity,
+        static_image_mode=False,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+def create_model(roi_size=roi_size, players=1):
+    # 推論モデルを作る (別プロセスからも呼ばれる)
+    if players > 1:
+        # レーンごとにモデルを作り、切り出した画像をまとめて推論する
+        return MultiPlayerModel([create_model(roi_size) for _ in range(players)])
+    if roi_size > 0:
+        return RoiModel(create_landmark_model(), roi_size)
+    return create_landmark_model()
+
+
+def show_frame(frame):
+    """
+    フレームをウィンドウに表示し、続行する場合はTrueを返す関数
+    """
+    cv2.imshow(window_name, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+
+def draw_hud(frame, timer, ball_count, voices_in_use=None):
+    """
+    fps、処理ごとの直近の時間、玉の数、鳴っている音の数をフレームの左上に描画する関数
+    """
+    lines = [f"fps: {timer.fps():.1f}"]
+    for stage, label in hud_stages:
+        elapsed = timer.last(stage)
+        if elapsed is not None:
+            lines.append(f"{label}: {elapsed:.1f} ms")
+    lines.append(f"balls: {ball_count}")
+    if voices_in_use is not None:
+        lines.append(f"voices: {voices_in_use}")
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (10, 25 + i * 22), font, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
+
+
+def draw_scores(frame, scores):
+    """
+    プレイヤーごとの得点をフレームの右上に描画する関数
+    """
+    for i, score in enumerate(scores.tolist()):
+        text = f"P{i + 1}: {score}"
+        (text_width, _), _ = cv2.getTextSize(text, font, 0.8, 2)
+        position = (frame.shape[1] - text_width - 10, 30 + i * 30)
+        cv2.putText(frame, text, position, font, 0.8, player_colors[i % len(player_colors)], 2, cv2.LINE_AA)
+
+
+def create_timeline(midi_file=None):
+    """
+    玉を出すイベントの時刻表を作る関数
+    midi_fileを指定するとそのドラムトラックの音符の時刻に玉がリングに着くようにする
+    """
+    travel_time = radius / (ball_speed * math.sqrt(2))  # 玉が中心からリングに着くまでの秒数 (random_velocityの速さ)
+    if midi_file is not None:
+        return compile_midi(midi_file, track_names, travel_time)
+    return compile_pattern(dict(zip(track_names, [hihat_beats, snare_beats, kick_beats])), BPM, travel_time)
+
+
+def run(cap, display=show_frame, load_sound=None, holistic=None, timer=None, pipeline_depth=0, roi_size=0,
+        voices=None, timeline=None, clock=time.monotonic, realtime=True, on_sound=None, hud=False,
+        latency=None, recorder=None, smoothing=True, segment_tracks=segment_tracks, players=1, views=None):
+    """
+    ゲームループ本体
+    cap: cv2.VideoCapture互換のオブジェクト
+    display: フレームを受け取り、続行する場合はTrueを返す関数
+    load_sound: 音源ファイルのパスから再生可能なオブジェクトを作る関数
+    pipeline_depth: 1以上なら推論を別プロセスで行い、最新の結果を使って描画を続ける
+    roi_size: 1以上なら前のフレームの体の周りを長辺roi_sizeまで縮小して推論する
+    voices: 音を鳴らすVoicePool (Noneなら各音源のplay()をそのまま呼ぶ)
+    timeline: 玉を出すイベントの時刻表 (Noneならhihat_beatsなどのパターンから作る)
+    clock: 現在の時刻(秒)を返す関数
+    realtime: Falseならシーケンサのスレッドを使わず、毎フレームclock()の時刻まで同じスレッドで進める
+    on_sound: 玉がリングを通過して音を鳴らしたときに on_sound(トラック番号, 時刻) で呼ばれる関数
+    hud: Trueならfpsや処理ごとの時間をフレームに描画する
+    latency: 撮影から表示・発音までの遅延を記録するtiming.LatencyTracker
+    recorder: フレームごとに使ったランドマークを記録するreplay.LandmarkRecorder
+    smoothing: Trueなら体の部位の位置をOne Euroフィルタで平滑化してから当たり判定に使う
+    segment_tracks: セグメントごとに当たったときに鳴らすトラックの番号 (Noneなら鳴らさない)
+    players: 一緒に遊ぶ人数 (2人以上ならプレイヤーごとに当たりと得点を数える)
+    views: capが複数のカメラを並べたフレームを返す場合の、カメラごとの範囲 (capture.MultiCapture.boxes)
+           pipeline_depthが1以上ならカメラごとの推論プロセスで並列に推論する
+    """
+    if recorder is not None and players > 1:
+        raise ValueError("landmark recording supports a single player")
+    model_factory = functools.partial(create_model, roi_size, players)
+    if load_sound is None:
+        load_sound = SampleBank().load
+    if holistic is None and pipeline_depth == 0:
+        holistic = model_factory()
+    if timer is None:
+        timer = StageTimer(maxlen=1000)
+    if timeline is None:
+        timeline = create_timeline()
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    center = (width // 2, height // 2)  # 画像の中心座標
+
+    hihat_sound = load_sound(hihat_sound_file)
+    snare_sound = load_sound(snare_sound_file)
+    kick_sound = load_sound(kick_sound_file)
+
+    sounds = [hihat_sound, snare_sound, kick_sound]
+    if voices is not None:
+        # トラックごとに予約したチャンネルで鳴らす
+        sounds = [voices.voice(name, sound) for name, sound in zip(track_names, sounds)]
+    balls = BallStore(track_colors, radius, (width, height))
+    # シーケンサのスレッドから届いたイベント (玉を出す時刻, リングに着く時刻, トラック番号)
+    events = queue.Queue()
+    pending_events = deque()
+
+    def play_arrival(track, arrival_time):
+        # シーケンサのスレッドから、玉がリングに着く時刻ちょうどに呼ばれる (描画や推論の速さに左右されない)
+        sound = sounds[track]
+        if sound is not None:
+            sound.play()
+        if latency is not None:
+            latency.dispatch(arrival_time)
+        if on_sound is not None:
+            on_sound(track, arrival_time)
+
+    sequencer = StepSequencer(timeline, events.put, clock, on_arrival=play_arrival)
+
+    # 各プレイヤーの各部位の最後に検出された位置 (検出されなかったフレームは前の位置のまま)
+    # 配列はプレイヤーごとにtracked_groupsの順に並ぶ
+    landmarks = LandmarkExtractor(tracked_groups, players=players)
+    point_count = players * len(tracked_groups)
+    point_colors = tracked_colors * players
+    tracked_points = np.zeros((point_count, 2), dtype=np.float64)
+    tracked_valid = np.zeros(point_count, dtype=bool)  # 前のフレームで検出されたか
+    tracked_time = None  # 前の推論結果のフレームの撮影時刻
+    # フレーム番号 -> 撮影時刻 (別プロセスの推論結果がいつ撮ったフレームのものかを調べる)
+    capture_times = {}
+    last_results_id = None
+    # カメラが一時的に止まっている間に代わりに使う最後のフレーム
+    last_frame = np.zeros((height, width, 3), dtype=np.uint8)
+    smoother = OneEuroFilter(point_count, smoothing_min_cutoff, smoothing_beta)
+
+    # リングの各セグメントを事前に描画しておく
+    ring = RingCompositor((height, width), center, radius, thickness)
+    # 座標からセグメントを引く表
+    ring_index = RingIndex(center, radius, thickness)
+    scoreboard = Scoreboard(players, ring_index.segments)
+    # セグメントの当たりを予測して先に鳴らす (鳴らしたチャンネルと音源は取り消し用に残す)
+    trigger = None
+    if segment_tracks is not None:
+        trigger = PredictiveTrigger(ring_index, prediction_horizon)
+        segment_channels = [(None, None)] * ring_index.segments
+
+    worker = None
+    if pipeline_depth > 0 and views is not None and len(views) > 1:
+        # フレームは左右反転してから推論するので、カメラごとの範囲も反転させる
+        boxes = [(width - x1, y0, width - x0, y1) for x0, y0, x1, y1 in views]
+        worker = InferencePool(boxes, model_factory, pipeline_depth)
+    elif pipeline_depth > 0:
+        worker = InferenceWorker((height, width, 3), model_factory, pipeline_depth)
+    try:
+        # キャプチャの開始 (最初のイベントは1拍後、それより前に玉を出す必要があればその分遅らせる)
+        now = clock()
+        first_spawn = timeline.next_time()
+        sequencer.start(now + max(interval, -first_spawn if first_spawn is not None else 0), threaded=realtime)
+        if recorder is not None:
+            recorder.start(now)
+        frame_id = 0
+        results = EMPTY_RESULTS
+        while cap.isOpened():
+            timer.tick()
+            with timer.stage("balls"):
+                if not realtime:
+                    sequencer.poll()
+                while True:
+                    try:
+                        pending_events.extend(events.get_nowait().tolist())
+                    except queue.Empty:
+                        break
+
+                # 時刻になった玉を、予定の時刻に出したものとして出す
+                # (音はシーケンサがarrival_timeに鳴らすので、ここでは描画と得点のために位置を進めるだけ)
+                frame_time = clock()
+                while pending_events and pending_events[0][0] <= frame_time:
+                    spawn_time, _, track = pending_events.popleft()
+                    balls.spawn(track, center, ball_speed, spawn_time)
+
+                # 今の時刻までにリングを通過した玉を調べ、画面外に出た玉を削除する
+                crossed, _ = balls.advance(frame_time)
+                # 玉が通過したセグメント (得点の計算に使う)
+                crossed_segments = np.floor(segment_position(balls.vx[crossed], balls.vy[crossed],
+                                                             ring_index.segments)).astype(np.intp)
+
+            with timer.stage("capture"):
+                ret, frame = cap.read()
+            if ret:
+                last_frame = frame
+            elif getattr(cap, "stalled", False):
+                # カメラが止まっても終わりにはせず、前のフレームで描画を続ける ('q'で終われるように)
+                frame = last_frame
+            else:
+                break
+            frame_id += 1
+            # ThreadedCaptureやMultiCaptureなら撮影した時刻、そうでなければ読み込んだ時刻
+            capture_time = getattr(cap, "timestamp", None)
+            if capture_time is None:
+                capture_time = clock()
+            capture_times[frame_id] = capture_time
+            if latency is not None:
+                latency.begin(frame_id, capture_time)
+
+            with timer.stage("convert"):
+                # 映像を反転させる
+                frame = cv2.flip(frame, 1)
+
+                # フレームをRGBに変換
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame.flags.writeable = False
+
+            # Mediapipeで手と姿勢を検出
+            with timer.stage("inference"):
+                results_time = None
+                if worker is None:
+                    results = holistic.process(frame)
+                    # 記録の再生(replay.LandmarkReplay)なら、記録したときの推論結果のフレーム番号と撮影時刻を使う
+                    results_id = getattr(holistic, "results_id", frame_id)
+                    results_time = getattr(holistic, "results_time", None)
+                else:
+                    # 推論は別プロセスに任せ、届いている最新の結果を使う
+                    worker.submit(frame, frame_id)
+                    results_id, results = worker.poll()
+            frame.flags.writeable = True
+            if latency is not None:
+                latency.mark(results_id, "landmarks")
+            if results_time is None:
+                # 推論結果のフレームの撮影時刻 (まだ結果が無ければ今のフレームの撮影時刻)
+                results_time = capture_times.get(results_id, capture_time)
+            if recorder is not None:
+                recorder.write(frame_time, capture_time, results, results_id, results_time)
+            # 推論結果が新しくなったか (別プロセスで推論する場合は同じ結果が何フレームか続く)
+            new_results = results_id != last_results_id
+            last_results_id = results_id
+            for old in [i for i in capture_times if i < results_id]:
+                del capture_times[old]
+
+            # 手と足の中心の座標を取得し、検出された部位に丸を描画
+            if new_results:
+                for player, player_results in enumerate(split_results(results, players)):
+                    landmarks.update(player_results, player)
+                centers, valid = landmarks.centers(frame.shape[1], frame.shape[0])
+                # 複数のカメラのうち使うカメラが変わった部位は位置が飛ぶので、続けて検出されたとは扱わない
+                # (飛んだ間を通り抜けたとしてリングに当てず、平滑化もその位置からやり直す)
+                switched = getattr(worker, "switched", None)
+                if switched is not None:
+                    jumped = landmarks.group_mask(switched)
+                    tracked_valid = tracked_valid & ~jumped
+                    smoother.reset(jumped)
+                # 同じ結果を何度も入れると速度が0に引っ張られるので、新しい結果だけをその撮影時刻で入れる
+                # (平滑化しない場合も、先取りに使う速度を求めるためにフィルタは動かす)
+                filtered = smoother.update(centers, valid, results_time)
+                if smoothing:
+                    centers = filtered
+                # 前の結果から続けて検出された部位は、前の位置から今の位置まで動いたとして当たりを調べる
+                previous = np.where((valid & tracked_valid)[:, None], tracked_points, centers)
+                tracked_points[valid] = centers[valid]
+                previous[~valid] = tracked_points[~valid]
+                tracked_valid = valid
+                sweep_start = results_time if tracked_time is None else tracked_time
+                tracked_time = results_time
+            else:
+                # 同じ結果が続く間は部位が動いていないので、今の位置の当たりだけを調べる
+                previous = tracked_points
+                sweep_start = tracked_time
+
+            # リングの当たり判定
+            with timer.stage("hit"):
+                # フレームの間に帯を飛び越えた場合も当たりにする
+                point_hits, _, _ = ring_index.sweep_points(previous, tracked_points, sweep_start, tracked_time)
+                # 全員の全部位の当たりを一度に調べてから、プレイヤーごとにまとめる
+                player_hits = point_hits.reshape(players, len(tracked_groups), -1).any(axis=1)
+                scoreboard.update(player_hits, crossed_segments)
+                hits = player_hits.any(axis=0)
+                if latency is not None:
+                    latency.mark(results_id, "hit")
+                if trigger is not None:
+                    fire, cancel = trigger.update(centers, smoother.velocity, valid, capture_time, hits)
+                    for segment in cancel.tolist():
+                        fade_out(*segment_channels[segment], cancel_fade_ms)
+                    for segment in fire.tolist():
+                        track = segment_tracks[segment]
+                        if track is None:
+                            continue
+                        sound = sounds[track]
+                        segment_channels[segment] = (sound.play(), sound)
+                        if latency is not None:
+                            latency.trigger(results_id)
+                        if on_sound is not None:
+                            on_sound(track, clock())
+
+            with timer.stage("draw"):
+                circle_thickness = 10
+                for (x, y), color, detected in zip(tracked_points.astype(np.int64).tolist(), point_colors, valid):
+                    if detected:
+                        cv2.circle(frame, (x, y), 30, color, circle_thickness)
+
+                # 玉を描画
+                balls.draw(frame)
+
+                # 円を描画
+                ring.composite(frame, hits)
+
+            # 玉の数と鳴っている音の数を記録
+            ball_count = len(balls)
+            voices_in_use = voices.busy() if voices is not None else None
+            timer.record("ball_count", ball_count)
+            if voices_in_use is not None:
+                timer.record("voices_in_use", voices_in_use)
+
+            # フレームを表示
+            with timer.stage("display"):
+                if hud:
+                    draw_hud(frame, timer, ball_count, voices_in_use)
+                if players > 1:
+                    draw_scores(frame, scoreboard.scores)
+                keep_running = display(frame)
+            if latency is not None:
+                latency.mark(results_id, "display")
+                latency.finish(results_id)
+            if not keep_running:
+                break
+    finally:
+        sequencer.stop()
+        if worker is not None:
+            worker.close()
+
+    return timer
+
+
+def main():
+    # ウェブカメラのキャプチャ (複数ならフレームの組をそろえて取る)
+    views = None
+    if len(camera_sources) > 1:
+        camera = MultiCapture.open(camera_sources)
+        views = camera.boxes
+    else:
+        camera = cv2.VideoCapture(camera_sources[0])
+    camera.set(cv2.CAP_PROP_FPS, frame_rate)
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    # 別スレッドで最新のフレームを取り続ける
+    cap = ThreadedCapture(camera).start()
+
+    # Pygameを初期化して音声を再生するための準備
+    pygame.mixer.init()
+
+    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+    cv2.resizeWindow(window_name, 800, 600)
+
+    voices = VoicePool(polyphony)
+    timeline = create_timeline(sys.argv[1] if len(sys.argv) > 1 else None)
+
+    # 記録から同じ玉の動きを再現できるように、乱数のシードを決めて記録に残す
+    seed = time.time_ns()
+    random.seed(seed)
+    recorder = None
+    if record_dir is not None and players == 1:
+        os.makedirs(record_dir, exist_ok=True)
+        path = os.path.join(record_dir, time.strftime("session-%Y%m%d-%H%M%S.npy"))
+        recorder = LandmarkRecorder(path, width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                    height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), seed=seed,
+                                    midi_file=sys.argv[1] if len(sys.argv) > 1 else None)
+
+    latency = LatencyTracker()
+    try:
+        timer = run(cap, timer=latency.timer, pipeline_depth=pipeline_depth, roi_size=roi_size, voices=voices,
+                    timeline=timeline, hud=show_hud, latency=latency, recorder=recorder, players=players,
+                    views=views)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    if metrics_file is not None:
+        timer.export(metrics_file)
+
+    # 音が足りなかった回数を表示する (polyphonyの調整用)
+    for track, stats in voices.stats().items():
+        print(f"{track}: played={stats['played']} stolen={stats['stolen']} dropped={stats['dropped']}")
+    # ゲームループが間に合わずに使われなかったフレームの数を表示する
+    print(f"camera: grabbed={cap.grabbed} dropped={cap.dropped}")
+    # 撮影から表示・発音までの遅延を表示する
+    for name, stats in latency.report().items():
+        print(f"{name}: p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms p99={stats['p99']:.1f}ms")
+
+    # リソースの解放
+    cap.release()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
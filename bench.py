@@ -0,0 +1,147 @@
+"""
+録画した動画をbeatles_011のゲームループに流し、処理ごとの時間を計測するスクリプト
+カメラ・ウィンドウ・サウンドカードが無い環境(CIなど)でも動作する
+
+使い方: python bench.py input.mp4 --seed 0 --frames 300
+複数の動画を渡すと、同時に撮った複数のカメラとして横に並べて流す (python bench.py left.mp4 right.mp4)
+--inference-delayで推論を遅くしても、玉の音が鳴る時刻(crossing->dispatch)が変わらないことを確かめられる
+"""
+import argparse
+import json
+import random
+import time
+
+import cv2
+
+import beatles_011
+from capture import MultiCapture
+from timing import LatencyTracker
+
+STAGES = ["capture", "convert", "inference", "balls", "hit", "draw", "display"]
+# 玉がリングに着く時刻から音の再生を要求するまでの遅延 (推論や描画の速さに左右されないはずのもの)
+SOUND_LATENCIES = ["crossing->dispatch"]
+
+
+class NullSound:
+    """
+    何もしない音源 (pygame.mixer.Soundの代わり)
+    """
+
+    def play(self):
+        pass
+
+
+class LimitedCapture:
+    """
+    指定したフレーム数で終了するキャプチャ
+    """
+
+    def __init__(self, cap, max_frames=None):
+        self.cap = cap
+        self.max_frames = max_frames
+        self.frames = 0
+
+    def isOpened(self):
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            return False
+        return self.cap.isOpened()
+
+    def read(self):
+        self.frames += 1
+        return self.cap.read()
+
+    @property
+    def timestamp(self):
+        # ThreadedCaptureなら最後に返したフレームの撮影時刻
+        return getattr(self.cap, "timestamp", None)
+
+    @property
+    def stalled(self):
+        # ThreadedCaptureならカメラが一時的に止まっているか
+        return getattr(self.cap, "stalled", False)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def release(self):
+        self.cap.release()
+
+
+def null_display(frame):
+    return True
+
+
+class DelayedModel:
+    """
+    推論が遅い環境を再現するため、推論のたびに決まった時間だけ待つモデル
+    """
+
+    def __init__(self, model, delay):
+        self.model = model
+        self.delay = delay
+
+    def process(self, frame):
+        results = self.model.process(frame)
+        time.sleep(self.delay)
+        return results
+
+
+def benchmark(video_path, seed=0, max_frames=None, pipeline_depth=0, roi_size=0, inference_delay=0.0):
+    """
+    video_path: 動画ファイルのパス (リストなら複数のカメラとして横に並べる)
+    inference_delay: 1フレームの推論に足す待ち時間(秒) (同期推論のときだけ使う)
+    """
+    random.seed(seed)
+    views = None
+    if isinstance(video_path, (list, tuple)) and len(video_path) > 1:
+        camera = MultiCapture.open(video_path)
+        views = camera.boxes
+    else:
+        camera = cv2.VideoCapture(video_path[0] if isinstance(video_path, (list, tuple)) else video_path)
+    cap = LimitedCapture(camera, max_frames)
+    latency = LatencyTracker()
+    timer = latency.timer
+    holistic = None
+    if inference_delay > 0 and pipeline_depth == 0:
+        holistic = DelayedModel(beatles_011.create_model(roi_size), inference_delay)
+    try:
+        beatles_011.run(cap, display=null_display, load_sound=lambda path: NullSound(), holistic=holistic,
+                         timer=timer, pipeline_depth=pipeline_depth, roi_size=roi_size, views=views,
+                         latency=latency)
+    finally:
+        cap.release()
+    return timer.percentiles()
+
+
+def format_table(stats):
+    lines = [f"{'stage':<18} {'count':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}"]
+    for name in STAGES + SOUND_LATENCIES:
+        if name not in stats:
+            continue
+        s = stats[name]
+        lines.append(f"{name:<18} {s['count']:>6} {s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless replay benchmark")
+    parser.add_argument("video", nargs="+", help="入力する動画ファイル (複数なら同時に撮った複数のカメラとして扱う)")
+    parser.add_argument("--seed", type=int, default=0, help="Ballの向きを決める乱数のシード")
+    parser.add_argument("--frames", type=int, default=None, help="処理する最大フレーム数")
+    parser.add_argument("--pipeline-depth", type=int, default=0, help="別プロセス推論のパイプラインの深さ (0なら同期推論)")
+    parser.add_argument("--roi-size", type=int, default=0, help="体の周りを切り出して推論する場合の長辺のピクセル数 (0ならフレーム全体)")
+    parser.add_argument("--inference-delay", type=float, default=0.0,
+                        help="推論を遅くする時間(ミリ秒) 負荷が高い環境の再現用 (同期推論のときだけ)")
+    parser.add_argument("--json", default=None, help="結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    stats = benchmark(args.video, args.seed, args.frames, args.pipeline_depth, args.roi_size,
+                      args.inference_delay / 1000)
+    print(format_table(stats))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class ThreadedCapture:
+    """
+    別スレッドでカメラから画像を取り続け、常に最新のフレームを返すクラス
+    cv2.VideoCaptureと同じようにisOpened / read / get / release が使える
+    timeout: read()が新しいフレームを待つ最大の秒数
+             (ドライバの中で止まったカメラを待ち続けて、ゲームループが固まらないようにする)
+    """
+
+    def __init__(self, cap, buffer_size=2, timeout=0.1):
+        self.cap = cap
+        self.timeout = timeout
+        self.buffer = deque(maxlen=buffer_size)  # (フレーム番号, 撮影時刻, フレーム)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+        self.grabbed = 0  # カメラから取得したフレーム数
+        self.dropped = 0  # ゲームループに渡らなかったフレーム数
+        self.last_id = -1
+        self.timestamp = None  # 最後に返したフレームの撮影時刻
+        self.stalled = False  # 最後のread()がtimeout秒待っても新しいフレームを得られなかったか
+
+    def start(self):
+        self.thread = threading.Thread(target=self._update, daemon=True)
+        self.thread.start()
+        return self
+
+    def _update(self):
+        try:
+            while not self.stopped:
+                ret, frame = self.cap.read()
+                # MultiCaptureならフレームの組の撮影時刻、そうでなければ読み込んだ時刻
+                timestamp = getattr(self.cap, "timestamp", None)
+                if timestamp is None:
+                    timestamp = time.monotonic()
+                if not ret:
+                    break
+                with self.condition:
+                    self.buffer.append((self.grabbed, timestamp, frame))
+                    self.grabbed += 1
+                    self.condition.notify_all()
+        finally:
+            # 終わったら(例外で抜けた場合も)待っているread()を起こす
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+
+    def isOpened(self):
+        with self.condition:
+            return self.cap.isOpened() and (not self.stopped or self._has_new_frame())
+
+    def _has_new_frame(self):
+        return bool(self.buffer) and self.buffer[-1][0] > self.last_id
+
+    def read_latest(self, timeout=None):
+        """
+        まだ返していない最新のフレームを待って返す関数
+        timeout: 待つ最大の秒数 (Noneならカメラが止まるまで待ち続ける)
+        戻り値: (ret, frame, 撮影時刻)
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self._has_new_frame() or self.stopped, timeout):
+                return False, None, None
+            if not self._has_new_frame():
+                return False, None, None
+            frame_id, timestamp, frame = self.buffer[-1]
+            # 間に取得されたフレームは使われずに捨てられる
+            self.dropped += frame_id - self.last_id - 1
+            self.last_id = frame_id
+            self.timestamp = timestamp
+            return True, frame, timestamp
+
+    def read(self):
+        # 待っても届かなければ(False, None)を返し、スレッドが動いている間はstalledにする
+        ret, frame, _ = self.read_latest(self.timeout)
+        self.stalled = not ret and not self.stopped
+        return ret, frame
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.cap.release()
+
+
+class MultiCapture:
+    """
+    複数のカメラ(または動画ファイル)から同じ時刻に撮ったフレームの組を取るクラス
+    先に全てのカメラでgrab()してから順にretrieve()することで、カメラ間の撮影時刻のずれを小さくする
+    read()はカメラの映像を横に並べた1枚のフレームを返すので、cv2.VideoCaptureと同じように使える
+
+    caps: cv2.VideoCapture互換のオブジェクトのリスト (先頭のカメラの高さにそろえて左から並べる)
+    """
+
+    def __init__(self, caps):
+        self.caps = list(caps)
+        self.height = int(self.caps[0].get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # 並べたフレームの中のカメラごとの範囲 (x0, y0, x1, y1)
+        self.boxes = []
+        x = 0
+        for cap in self.caps:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            scaled = round(width * self.height / height) if height > 0 else width
+            self.boxes.append((x, 0, x + scaled, self.height))
+            x += scaled
+        self.width = x
+        self.timestamp = None  # 最後に取ったフレームの組の撮影時刻 (grab()した時刻の中央)
+        self.skew = 0.0  # 最後の組の最初と最後のgrab()の時刻の差(秒)
+        self.sets = 0  # 取ったフレームの組の数
+
+    @classmethod
+    def open(cls, sources):
+        """
+        カメラの番号か動画ファイルのパスのリストから作る関数
+        """
+        return cls([cv2.VideoCapture(source) for source in sources])
+
+    def isOpened(self):
+        return all(cap.isOpened() for cap in self.caps)
+
+    def read_set(self):
+        """
+        全てのカメラから同じ時刻のフレームを取る関数
+        戻り値: (ret, カメラごとのフレームのリスト)
+        """
+        # grab()は撮影済みのフレームを確保するだけで軽いので、全てのカメラで続けて呼ぶ
+        times = []
+        for cap in self.caps:
+            if not cap.grab():
+                return False, None
+            times.append(time.monotonic())
+        # 重いデコードはそろえて確保した後に行う
+        frames = []
+        for cap in self.caps:
+            ret, frame = cap.retrieve()
+            if not ret:
+                return False, None
+            frames.append(frame)
+        self.timestamp = (times[0] + times[-1]) / 2
+        self.skew = times[-1] - times[0]
+        self.sets += 1
+        return True, frames
+
+    def stitch(self, frames):
+        """
+        カメラごとのフレームを横に並べた1枚のフレームを返す関数
+        """
+        # ThreadedCaptureがバッファに残すので、使い回さずに毎回確保する
+        stitched = np.empty((self.height, self.width) + frames[0].shape[2:], dtype=frames[0].dtype)
+        for (x0, y0, x1, y1), frame in zip(self.boxes, frames):
+            if frame.shape[:2] != (y1 - y0, x1 - x0):
+                frame = cv2.resize(frame, (x1 - x0, y1 - y0), interpolation=cv2.INTER_AREA)
+            stitched[y0:y1, x0:x1] = frame
+        return stitched
+
+    def read(self):
+        ret, frames = self.read_set()
+        if not ret:
+            return False, None
+        return True, self.stitch(frames)
+
+    def get(self, prop):
+        # 大きさは並べたフレームのもの、それ以外は先頭のカメラのもの
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return self.caps[0].get(prop)
+
+    def set(self, prop, value):
+        return all([cap.set(prop, value) for cap in self.caps])
+
+    def release(self):
+        for cap in self.caps:
+            cap.release()
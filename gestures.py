@@ -0,0 +1,83 @@
+"""
+姿勢のランドマークから関節の角度を求め、角度の変化をジェスチャーとして検出するモジュール
+全ての関節の角度を一回の配列演算で求め、ジェスチャーごとの状態もまとめて更新する
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# 関節の角度を求める3点 (端, 関節, 端) の姿勢のランドマークの番号
+JOINTS = {
+    "left_elbow": (11, 13, 15),  # 肩, 肘, 手首
+    "right_elbow": (12, 14, 16),
+    "left_shoulder": (23, 11, 13),  # 腰, 肩, 肘
+    "right_shoulder": (24, 12, 14),
+    "left_knee": (23, 25, 27),  # 腰, 膝, 足首
+    "right_knee": (24, 26, 28),
+    "left_hip": (11, 23, 25),  # 肩, 腰, 膝
+    "right_hip": (12, 24, 26),
+}
+
+# joint: JOINTSの名前
+# enter: 角度がこの値を越えたらジェスチャーが始まる (度)
+# exit: 角度がこの値を戻ったら次のジェスチャーを受け付ける (度)
+# enter < exit なら曲げたとき、enter > exit なら伸ばしたときに始まる
+Gesture = namedtuple("Gesture", ["name", "joint", "enter", "exit"])
+
+
+def joint_angles(points, index, scale=(1.0, 1.0)):
+    """
+    関節の角度(0〜180度)をまとめて求める関数
+    points: (N, 2以上)のランドマークの座標 (正規化座標)
+    index: (関節数, 3)の (端, 関節, 端) の番号
+    scale: x, yに掛ける値 (フレームの幅と高さを渡すと縦横比の歪みが無くなる)
+    """
+    xy = points[index, :2] * np.asarray(scale, dtype=np.float64)
+    a = xy[:, 0] - xy[:, 1]
+    c = xy[:, 2] - xy[:, 1]
+    cross = a[:, 0] * c[:, 1] - a[:, 1] * c[:, 0]
+    dot = (a * c).sum(axis=1)
+    return np.degrees(np.arctan2(np.abs(cross), dot))
+
+
+class GestureEngine:
+    """
+    ジェスチャーごとに、始まり(enter)と終わり(exit)の二つのしきい値を持つ状態を管理するクラス
+    しきい値の近くで角度がぶれても、一度始まったジェスチャーはexitを越えるまで再び始まらない
+
+    gestures: Gestureのリスト
+    min_visibility: 3点のvisibilityがこれより低い関節は状態を変えない
+    """
+
+    def __init__(self, gestures, joints=JOINTS, min_visibility=0.5):
+        self.gestures = list(gestures)
+        self.names = [gesture.name for gesture in self.gestures]
+        self.min_visibility = min_visibility
+        self.index = np.array([joints[gesture.joint] for gesture in self.gestures], dtype=np.intp).reshape(-1, 3)
+        enter = np.array([gesture.enter for gesture in self.gestures], dtype=np.float64)
+        exit_ = np.array([gesture.exit for gesture in self.gestures], dtype=np.float64)
+        # 伸ばすジェスチャーは符号を反転して、どれも「しきい値を下回ったら始まる」として扱う
+        self.sign = np.where(enter <= exit_, 1.0, -1.0)
+        self.enter = enter * self.sign
+        self.exit = exit_ * self.sign
+        self.active = np.zeros(len(self.gestures), dtype=bool)
+        self.angles = np.zeros(len(self.gestures), dtype=np.float64)
+
+    def reset(self):
+        self.active[:] = False
+
+    def update(self, points, visibility=None, scale=(1.0, 1.0)):
+        """
+        ランドマークから状態を更新し、このフレームで始まったジェスチャーの番号を返す関数
+        points: (N, 2以上)の姿勢のランドマークの座標
+        visibility: (N,)の各ランドマークのvisibility (Noneなら全て見えているとする)
+        """
+        self.angles = joint_angles(points, self.index, scale)
+        signed = self.angles * self.sign
+        valid = np.ones(len(self.gestures), dtype=bool)
+        if visibility is not None:
+            valid = visibility[self.index].min(axis=1) >= self.min_visibility
+        entered = valid & ~self.active & (signed < self.enter)
+        exited = valid & self.active & (signed > self.exit)
+        self.active ^= entered | exited
+        return np.flatnonzero(entered)
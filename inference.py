@@ -0,0 +1,354 @@
+import multiprocessing
+import queue
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+Landmark = namedtuple("Landmark", ["x", "y", "z", "visibility"])
+Results = namedtuple("Results", ["left_hand_landmarks", "right_hand_landmarks", "pose_landmarks"])
+
+EMPTY_RESULTS = Results(None, None, None)
+
+
+class LandmarkArray:
+    """
+    (N, 4)の配列をMediapipeのランドマークと同じように
+    .landmark[i].x で参照できるようにするクラス
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    @property
+    def landmark(self):
+        return [Landmark(*row) for row in self.array.tolist()]
+
+
+def landmarks_to_array(landmarks):
+    """
+    Mediapipeのランドマークを(N, 4)の配列(x, y, z, visibility)に変換する関数
+    """
+    if landmarks is None:
+        return None
+    if isinstance(landmarks, LandmarkArray):
+        return landmarks.array
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks.landmark], dtype=np.float32)
+
+
+def _wrap(array):
+    return None if array is None else LandmarkArray(array)
+
+
+def crop_to_frame(array, box, width, height):
+    """
+    切り出した画像の正規化座標の(N, 4)の配列を、フレーム全体の正規化座標に戻す関数
+    box: 切り出した範囲 (x0, y0, x1, y1)
+    """
+    if array is None:
+        return None
+    x0, y0, x1, y1 = box
+    array = array.copy()
+    array[:, 0] = (array[:, 0] * (x1 - x0) + x0) / width
+    array[:, 1] = (array[:, 1] * (y1 - y0) + y0) / height
+    array[:, 2] = array[:, 2] * (x1 - x0) / width
+    return array
+
+
+def results_to_arrays(results):
+    """
+    推論結果を(左手, 右手, 姿勢)の配列のタプルにする関数 (複数人の結果のリストならタプルのリスト)
+    """
+    if isinstance(results, list):
+        return [results_to_arrays(player) for player in results]
+    return (
+        landmarks_to_array(results.left_hand_landmarks),
+        landmarks_to_array(results.right_hand_landmarks),
+        landmarks_to_array(results.pose_landmarks),
+    )
+
+
+def arrays_to_results(arrays):
+    # 1人分は(左手, 右手, 姿勢)のタプル、複数人はそのリスト
+    if isinstance(arrays, list):
+        return [arrays_to_results(player) for player in arrays]
+    return Results(*[_wrap(array) for array in arrays])
+
+
+class RoiModel:
+    """
+    前のフレームで検出した体の周りだけを切り出し、縮小してから推論するクラス
+    結果のランドマークはフレーム全体の正規化座標に戻して返す
+    見失った場合は次のフレームをフレーム全体で推論する
+
+    切り出す範囲は毎フレーム変えず、体が範囲の端に近づいたときと、範囲が体に比べて大きくなりすぎたときだけ
+    切り出し直す (Mediapipeのトラッキングや平滑化は前の切り出しの座標で動くので、範囲が動くと遅れやぶれになる)
+
+    model: process(frame)を持つ推論モデル (mp_holistic.Holisticなど)
+    size: 推論に渡す画像の長辺の最大ピクセル数
+    padding: 体の外接矩形の周りに足す余白 (矩形の長辺に対する割合)
+    min_fraction: 切り出す範囲の一辺の最小値 (フレームの短辺に対する割合)
+    edge_margin: 体が範囲の端からこの距離(範囲の長辺に対する割合)より内側にいる間は切り出し直さない
+    shrink_ratio: 切り出し直した範囲の面積が今の範囲のこの割合より小さくなるなら切り出し直す
+    """
+
+    def __init__(self, model, size=256, padding=0.3, min_fraction=0.3, min_visibility=0.5, edge_margin=0.05,
+                 shrink_ratio=0.5):
+        self.model = model
+        self.size = size
+        self.padding = padding
+        self.min_fraction = min_fraction
+        self.min_visibility = min_visibility
+        self.edge_margin = edge_margin
+        self.shrink_ratio = shrink_ratio
+        self.box = None  # 次に切り出す範囲 (x0, y0, x1, y1)、Noneならフレーム全体
+        self.recrops = 0  # 切り出す範囲を変えた回数
+
+    def process(self, frame):
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = self.box or (0, 0, width, height)
+        crop = frame[y0:y1, x0:x1]
+        scale = self.size / max(crop.shape[:2])
+        if scale < 1:
+            crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        results = self.model.process(np.ascontiguousarray(crop))
+
+        # 切り出した画像の座標からフレーム全体の座標に戻す
+        arrays = tuple(crop_to_frame(array, (x0, y0, x1, y1), width, height) for array in results_to_arrays(results))
+        box = self._next_box(arrays, width, height)
+        if box is None or self.box is None or self._needs_recrop(box, arrays, width, height):
+            if box != self.box:
+                self.recrops += 1
+            self.box = box
+        return arrays_to_results(arrays)
+
+    def _points(self, arrays, width, height):
+        # 検出された点のピクセル座標
+        left_hand, right_hand, pose = arrays
+        points = [array[:, :2] for array in (left_hand, right_hand) if array is not None]
+        if pose is not None:
+            points.append(pose[pose[:, 3] >= self.min_visibility, :2])
+        points = np.concatenate(points) if points else np.empty((0, 2))
+        return points * np.array([width, height])
+
+    def _needs_recrop(self, box, arrays, width, height):
+        x0, y0, x1, y1 = self.box
+        points = self._points(arrays, width, height)
+        margin = self.edge_margin * max(x1 - x0, y1 - y0)
+        # フレームの端に接している辺は、それ以上広げられないので調べない
+        near_edge = (
+            (x0 > 0 and points[:, 0].min() < x0 + margin)
+            or (y0 > 0 and points[:, 1].min() < y0 + margin)
+            or (x1 < width and points[:, 0].max() > x1 - margin)
+            or (y1 < height and points[:, 1].max() > y1 - margin)
+        )
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        return bool(near_edge) or area < self.shrink_ratio * (x1 - x0) * (y1 - y0)
+
+    def _next_box(self, arrays, width, height):
+        points = self._points(arrays, width, height)
+        if len(points) == 0:
+            return None
+        xs = points[:, 0]
+        ys = points[:, 1]
+        pad = self.padding * max(xs.max() - xs.min(), ys.max() - ys.min())
+        # 小さくなりすぎないように、中心を変えずに最小の大きさまで広げる
+        half = self.min_fraction * min(width, height) / 2
+        cx = (xs.max() + xs.min()) / 2
+        cy = (ys.max() + ys.min()) / 2
+        x0 = int(max(0, min(xs.min() - pad, cx - half)))
+        y0 = int(max(0, min(ys.min() - pad, cy - half)))
+        x1 = int(min(width, max(xs.max() + pad, cx + half)))
+        y1 = int(min(height, max(ys.max() + pad, cy + half)))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        return x0, y0, x1, y1
+
+
+def _worker(shm_name, shape, depth, requests, responses, create_model):
+    # 共有メモリ上のフレームをコピーせずに参照する
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((depth,) + shape, dtype=np.uint8, buffer=shm.buf)
+    model = create_model()
+    try:
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            slot, frame_id = item
+            results = model.process(frames[slot])
+            responses.put((slot, frame_id, results_to_arrays(results)))
+    finally:
+        del frames
+        shm.close()
+
+
+class InferenceWorker:
+    """
+    別プロセスでMediapipeの推論を行うクラス
+    depth: 同時に推論待ちにできるフレーム数 (大きいほどスループット重視、小さいほど遅延重視)
+    create_model: 推論モデルを作る関数 (子プロセスで呼ばれるのでモジュールの関数にする)
+    """
+
+    def __init__(self, shape, create_model, depth=2):
+        self.shape = tuple(shape)
+        self.depth = depth
+        size = int(np.prod(self.shape)) * depth
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray((depth,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.free_slots = list(range(depth))
+
+        ctx = multiprocessing.get_context("spawn")
+        self.requests = ctx.Queue()
+        self.responses = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker,
+            args=(self.shm.name, self.shape, depth, self.requests, self.responses, create_model),
+            daemon=True,
+        )
+        self.process.start()
+
+        self.latest_id = -1
+        self.results = EMPTY_RESULTS
+
+    def submit(self, frame, frame_id):
+        """
+        空いているスロットがあればフレームを推論に回す関数
+        空きが無ければ何もせずFalseを返す
+        """
+        self.poll()
+        if not self.free_slots:
+            return False
+        slot = self.free_slots.pop()
+        np.copyto(self.frames[slot], frame)
+        self.requests.put((slot, frame_id))
+        return True
+
+    def poll(self):
+        """
+        届いている推論結果を取り込み、最新の(フレーム番号, 結果)を返す関数
+        """
+        while True:
+            try:
+                slot, frame_id, arrays = self.responses.get_nowait()
+            except queue.Empty:
+                break
+            self.free_slots.append(slot)
+            if frame_id > self.latest_id:
+                self.latest_id = frame_id
+                self.results = arrays_to_results(arrays)
+        return self.latest_id, self.results
+
+    def close(self):
+        self.requests.put(None)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+
+# 使うカメラを切り替えるのに必要なvisibilityの平均の差
+# (カメラごとの映像は並べたフレームの別の場所にあるので、切り替えると位置が飛ぶ)
+VIEW_SWITCH_MARGIN = 0.2
+
+
+def merge_views(views, previous=None, margin=VIEW_SWITCH_MARGIN):
+    """
+    カメラごとの推論結果の配列(フレーム全体の座標に戻したもの)を一つにまとめる関数
+    姿勢・左手・右手それぞれについて、visibilityの平均が最も高いカメラの結果を使う
+    ただし前回使ったカメラで見えている間は、他のカメラがmargin以上高くならない限り切り替えない
+    views: カメラごとの(左手, 右手, 姿勢)のタプル (複数人ならタプルのリスト)
+    previous: 前回の部位ごとのカメラの番号 (前回の戻り値、Noneなら前回は無し)
+    戻り値: (まとめた配列, 部位ごとに使ったカメラの番号 (見えなければ-1))
+    """
+    if isinstance(views[0], list):
+        players = list(zip(*views))
+        previous = previous or [None] * len(players)
+        merged = [merge_views(list(player), last, margin) for player, last in zip(players, previous)]
+        return [arrays for arrays, _ in merged], [sources for _, sources in merged]
+    merged = []
+    sources = []
+    for part, last in zip(zip(*views), previous or (-1, -1, -1)):
+        scores = [-1.0 if array is None else float(array[:, 3].mean()) for array in part]
+        # 手のvisibilityは常に0なので、同じ値なら先に並んだカメラを使う
+        best = int(np.argmax(scores))
+        if scores[best] < 0:
+            merged.append(None)
+            sources.append(-1)
+            continue
+        if 0 <= last < len(part) and part[last] is not None and scores[best] < scores[last] + margin:
+            best = last
+        merged.append(part[best])
+        sources.append(best)
+    return tuple(merged), tuple(sources)
+
+
+class InferencePool:
+    """
+    複数のカメラの映像を横に並べたフレームを、カメラごとの推論プロセスに分けて並列に推論するクラス
+    結果はフレーム全体の座標に戻してからmerge_viewsでまとめる
+    InferenceWorkerと同じように submit / poll / close が使える
+
+    boxes: フレームの中のカメラごとの範囲 (x0, y0, x1, y1) のリスト (capture.MultiCapture.boxes)
+    """
+
+    def __init__(self, boxes, create_model, depth=2):
+        self.boxes = [tuple(box) for box in boxes]
+        self.width = max(box[2] for box in self.boxes)
+        self.height = max(box[3] for box in self.boxes)
+        self.workers = [InferenceWorker((y1 - y0, x1 - x0, 3), create_model, depth)
+                        for x0, y0, x1, y1 in self.boxes]
+        self.latest_id = -1
+        self.results = EMPTY_RESULTS
+        self.sources = None  # 部位ごとに使ったカメラの番号 (merge_viewsの戻り値)
+        # 最新の結果で使うカメラが変わった部位 (人数, 3) 左手・右手・姿勢の順
+        # 位置が別のカメラの場所に飛ぶので、呼び出し側は前の位置から続けて動いたとは扱わない
+        self.switched = None
+
+    def submit(self, frame, frame_id):
+        """
+        全てのカメラの推論プロセスに空きがあれば、フレームの組をまとめて推論に回す関数
+        一つでも空きが無ければ同じ時刻の組を崩さないように何もせずFalseを返す
+        """
+        for worker in self.workers:
+            worker.poll()
+        if not all(worker.free_slots for worker in self.workers):
+            return False
+        for worker, (x0, y0, x1, y1) in zip(self.workers, self.boxes):
+            worker.submit(frame[y0:y1, x0:x1], frame_id)
+        return True
+
+    def poll(self):
+        """
+        届いている推論結果を取り込み、全てのカメラの結果がそろった最新の(フレーム番号, 結果)を返す関数
+        """
+        latest = [worker.poll() for worker in self.workers]
+        frame_id = min(worker_id for worker_id, _ in latest)
+        if frame_id > self.latest_id:
+            self.latest_id = frame_id
+            views = []
+            for (_, results), box in zip(latest, self.boxes):
+                arrays = results_to_arrays(results)
+                if isinstance(arrays, list):
+                    views.append([tuple(crop_to_frame(array, box, self.width, self.height) for array in player)
+                                  for player in arrays])
+                else:
+                    views.append(tuple(crop_to_frame(array, box, self.width, self.height) for array in arrays))
+            merged, sources = merge_views(views, self.sources)
+            previous = self.sources
+            if previous is None:
+                previous = [(-1, -1, -1)] * len(sources) if isinstance(sources, list) else (-1, -1, -1)
+            old = np.array(previous, dtype=np.int64).reshape(-1, 3)
+            new = np.array(sources, dtype=np.int64).reshape(-1, 3)
+            self.switched = (old >= 0) & (new >= 0) & (old != new)
+            self.sources = sources
+            self.results = arrays_to_results(merged)
+        return self.latest_id, self.results
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
@@ -0,0 +1,99 @@
+import numpy as np
+
+# 全身のランドマークを一つの配列にまとめたときの並び
+# 0-32: 姿勢(pose), 33-53: 左手, 54-74: 右手
+POSE_OFFSET = 0
+LEFT_HAND_OFFSET = 33
+RIGHT_HAND_OFFSET = 54
+NUM_LANDMARKS = 75
+
+FINGERTIPS = [4, 8, 12, 16, 20]  # 手のランドマークのうち指先の番号
+
+# 名前付きのキーポイントのグループ (中心を求めるランドマークの番号)
+KEYPOINT_GROUPS = {
+    "left_hand": list(range(LEFT_HAND_OFFSET, LEFT_HAND_OFFSET + 21)),
+    "right_hand": list(range(RIGHT_HAND_OFFSET, RIGHT_HAND_OFFSET + 21)),
+    "left_foot": [27, 29, 31],
+    "right_foot": [28, 30, 32],
+    "left_wrist": [15],
+    "right_wrist": [16],
+    "left_fingertips": [LEFT_HAND_OFFSET + i for i in FINGERTIPS],
+    "right_fingertips": [RIGHT_HAND_OFFSET + i for i in FINGERTIPS],
+}
+
+
+class LandmarkExtractor:
+    """
+    Mediapipeの結果(姿勢・左手・右手)を事前に確保した配列に書き込み、
+    指定したグループの中心を一回の配列演算で求めるクラス
+
+    groups: 中心を求めるグループ名のリスト (KEYPOINT_GROUPSのキー)
+    players: 人数 (プレイヤーごとに配列の行を持ち、全員の中心を一回の配列演算で求める)
+    """
+
+    def __init__(self, groups, keypoint_groups=KEYPOINT_GROUPS, players=1):
+        self.groups = list(groups)
+        self.players = players
+        self.points = np.zeros((players, NUM_LANDMARKS, 3), dtype=np.float64)  # x, y, z (正規化座標)
+        self.visibility = np.zeros((players, NUM_LANDMARKS), dtype=np.float64)
+        self.present = np.zeros((players, NUM_LANDMARKS), dtype=bool)  # 検出されたランドマーク
+
+        # グループごとの番号を(グループ数, 最大の点数)の表にまとめる (足りない分は重み0)
+        size = max(len(keypoint_groups[name]) for name in self.groups)
+        self.index = np.zeros((len(self.groups), size), dtype=np.intp)
+        self.weights = np.zeros((len(self.groups), size), dtype=np.float64)
+        for g, name in enumerate(self.groups):
+            indices = keypoint_groups[name]
+            self.index[g, :len(indices)] = indices
+            self.weights[g, :len(indices)] = 1
+
+    def _fill(self, player, offset, count, landmarks):
+        part = slice(offset, offset + count)
+        if landmarks is None:
+            self.present[player, part] = False
+            return
+        array = getattr(landmarks, "array", None)
+        if array is not None:
+            # 別プロセスの推論結果はすでに配列になっている
+            self.points[player, part] = array[:count, :3]
+            self.visibility[player, part] = array[:count, 3]
+        else:
+            for i, landmark in enumerate(landmarks.landmark[:count]):
+                self.points[player, offset + i] = (landmark.x, landmark.y, landmark.z)
+                self.visibility[player, offset + i] = landmark.visibility
+        self.present[player, part] = True
+
+    def update(self, results, player=0):
+        self._fill(player, POSE_OFFSET, 33, results.pose_landmarks)
+        self._fill(player, LEFT_HAND_OFFSET, 21, results.left_hand_landmarks)
+        self._fill(player, RIGHT_HAND_OFFSET, 21, results.right_hand_landmarks)
+
+    def group_mask(self, parts):
+        """
+        部位ごとのbool配列を、その部位のランドマークを含むグループのbool配列にする関数
+        parts: (人数, 3)の左手・右手・姿勢の順のbool配列 (推論結果のResultsと同じ順)
+        戻り値: (人数 * グループ数,)のbool配列 (centersと同じ並び)
+        """
+        parts = np.asarray(parts, dtype=bool).reshape(self.players, 3)
+        mask = np.zeros((self.players, NUM_LANDMARKS), dtype=bool)
+        for i, (offset, count) in enumerate([(LEFT_HAND_OFFSET, 21), (RIGHT_HAND_OFFSET, 21), (POSE_OFFSET, 33)]):
+            mask[:, offset:offset + count] = parts[:, i, None]
+        return np.any(mask[:, self.index] & (self.weights > 0), axis=2).reshape(-1)
+
+    def centers(self, width, height):
+        """
+        各グループの中心のピクセル座標(小数)と、検出されたかどうかを返す関数
+        戻り値: (人数 * グループ数, 2)のfloat配列, (人数 * グループ数,)のbool配列 (プレイヤーごとに並ぶ)
+        """
+        xy = self.points[:, self.index, :2]
+        valid = np.all(self.present[:, self.index] | (self.weights == 0), axis=2)
+        center = (xy * self.weights[:, :, None]).sum(axis=2) / self.weights.sum(axis=1)[:, None]
+        return (center * np.array([width, height])).reshape(-1, 2), valid.reshape(-1)
+
+    def centroids(self, width, height):
+        """
+        各グループの中心のピクセル座標と、検出されたかどうかを返す関数
+        戻り値: (人数 * グループ数, 2)のint配列, (人数 * グループ数,)のbool配列
+        """
+        center, valid = self.centers(width, height)
+        return center.astype(np.int64), valid
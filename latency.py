@@ -0,0 +1,129 @@
+"""
+体の動きが画面と音に反映されるまでの遅延を計測するキャリブレーション用のスクリプト
+音声出力の代わりにLoopbackDeviceを使い、再生を要求してから音が出るまでの遅延も含めて
+timing.LatencyTrackerの区間ごとの遅延を計測する
+
+使い方: python latency.py --video input.mp4 --frames 300 (--videoを省略するとカメラ)
+"""
+import argparse
+import json
+import queue
+import threading
+
+import cv2
+
+import beatles_011
+from bench import LimitedCapture, null_display
+from capture import ThreadedCapture
+from timing import LATENCIES, LatencyTracker
+
+
+class LoopbackDevice:
+    """
+    音声出力デバイスの代わりになるクラス
+    実際のデバイスと同じようにbuffer/frequency秒ごとに再生要求をまとめて取り出し、
+    取り出したバッファが再生される(次の周期の)時刻を音が出た時刻として記録する
+    """
+
+    def __init__(self, latency, frequency=44100, buffer=512):
+        self.latency = latency
+        self.period = buffer / frequency
+        self.requests = queue.Queue()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join(timeout=1.0)
+
+    def sound(self, path):
+        """
+        play()で再生を要求する音源を返す関数 (load_soundとして使える)
+        """
+        return LoopbackSound(self)
+
+    def _run(self):
+        clock = self.latency.clock
+        next_time = clock()
+        while not self._stop.is_set():
+            next_time += self.period
+            self._stop.wait(max(0.0, next_time - clock()))
+            mixed = clock()
+            while True:
+                try:
+                    dispatched = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                self.latency.output(dispatched, mixed + self.period)
+
+
+class LoopbackSound:
+    def __init__(self, device):
+        self.device = device
+
+    def play(self):
+        self.device.requests.put(self.device.latency.clock())
+
+
+def calibrate(cap, max_frames=None, frequency=44100, buffer=512, display=null_display, pipeline_depth=0,
+              roi_size=0):
+    """
+    LoopbackDeviceを出力先にしてゲームループを動かし、遅延のパーセンタイルを返す関数
+    """
+    latency = LatencyTracker()
+    device = LoopbackDevice(latency, frequency, buffer).start()
+    try:
+        beatles_011.run(LimitedCapture(cap, max_frames), display=display, load_sound=device.sound,
+                        timer=latency.timer, pipeline_depth=pipeline_depth, roi_size=roi_size, latency=latency)
+    finally:
+        device.stop()
+    return latency.report()
+
+
+def format_table(stats):
+    lines = [f"{'latency':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'count':>8}"]
+    for name in LATENCIES:
+        if name in stats:
+            s = stats[name]
+            lines.append(f"{name:<20}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['count']:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="motion-to-sound latency calibration")
+    parser.add_argument("--video", default=None, help="入力する動画ファイル (省略するとカメラ)")
+    parser.add_argument("--frames", type=int, default=300, help="計測するフレーム数")
+    parser.add_argument("--buffer", type=int, default=512, help="出力デバイスのバッファのサンプル数")
+    parser.add_argument("--frequency", type=int, default=44100, help="出力デバイスのサンプリング周波数")
+    parser.add_argument("--pipeline-depth", type=int, default=0, help="推論を別プロセスで行う場合のパイプラインの深さ")
+    parser.add_argument("--roi-size", type=int, default=0, help="体の周りを縮小して推論する場合の長辺のピクセル数")
+    parser.add_argument("--json", default=None, help="結果をJSONで書き出すパス")
+    args = parser.parse_args()
+
+    if args.video is None:
+        camera = cv2.VideoCapture(0)
+        camera.set(cv2.CAP_PROP_FPS, beatles_011.frame_rate)
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cap = ThreadedCapture(camera).start()
+        display = beatles_011.show_frame
+    else:
+        cap = cv2.VideoCapture(args.video)
+        display = null_display
+    try:
+        stats = calibrate(cap, args.frames, args.frequency, args.buffer, display, args.pipeline_depth,
+                          args.roi_size)
+    finally:
+        cap.release()
+        cv2.destroyAllWindows()
+    print(format_table(stats))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
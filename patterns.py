@@ -0,0 +1,240 @@
+"""
+ドラムのパターン(ステップの並びやMIDIファイル)を、時刻順に並んだイベントの配列に変換するモジュール
+ゲームループはステップの計算をせず、配列の読み出し位置(カーソル)を進めるだけでよい
+"""
+import math
+import struct
+from fractions import Fraction
+
+import numpy as np
+
+# イベント1つ分: 玉を出す時刻、玉がリングに着く時刻(曲の先頭からの秒数)、トラック番号
+EVENT_DTYPE = np.dtype([("spawn_time", np.float64), ("arrival_time", np.float64), ("track", np.int16)])
+
+# General MIDIのドラムのノート番号とトラック名の対応
+GM_DRUM_MAP = {
+    35: "kick", 36: "kick",
+    37: "snare", 38: "snare", 39: "snare", 40: "snare",
+    42: "hihat", 44: "hihat", 46: "hihat",
+}
+
+
+class TempoMap:
+    """
+    拍(beat)と秒を相互に変換するクラス
+    tempo: BPMの数値、または[(拍, BPM), ...]のテンポ変化のリスト
+    """
+
+    def __init__(self, tempo):
+        if isinstance(tempo, (int, float)):
+            tempo = [(0, tempo)]
+        changes = sorted((float(beat), float(bpm)) for beat, bpm in tempo)
+        if not changes or changes[0][0] > 0:
+            raise ValueError("tempo must start at beat 0")
+        self.beats = np.array([beat for beat, _ in changes])
+        self.bpm = np.array([bpm for _, bpm in changes])
+        # 各テンポ変化の時刻(秒)
+        durations = np.diff(self.beats) * 60 / self.bpm[:-1]
+        self.seconds = np.concatenate([[0.0], np.cumsum(durations)])
+
+    def to_seconds(self, beats):
+        beats = np.asarray(beats, dtype=np.float64)
+        i = np.searchsorted(self.beats, beats, side="right") - 1
+        return self.seconds[i] + (beats - self.beats[i]) * 60 / self.bpm[i]
+
+
+def _lcm(a, b):
+    # 分数どうしの最小公倍数
+    a, b = Fraction(a), Fraction(b)
+    numerator = a.numerator * b.numerator // math.gcd(a.numerator, b.numerator)
+    return Fraction(numerator, math.gcd(a.denominator, b.denominator))
+
+
+def compile_events(notes, track_names, tempo, travel_time=0.0, align="spawn", loop_beats=None):
+    """
+    [(拍, トラック名), ...]をイベントの時刻表(EventTimeline)に変換する関数
+    travel_time: 玉が中心からリングに着くまでの秒数
+    align: "spawn"なら音符の時刻に玉を出し、"arrival"なら音符の時刻に玉がリングに着くようにする
+    loop_beats: 何拍ごとに繰り返すか (Noneなら繰り返さない)
+    """
+    tempo_map = TempoMap(tempo)
+    events = np.zeros(len(notes), dtype=EVENT_DTYPE)
+    if notes:
+        beats, names = zip(*notes)
+        times = tempo_map.to_seconds(np.array(beats, dtype=np.float64))
+        events["track"] = [track_names.index(name) for name in names]
+        if align == "spawn":
+            events["spawn_time"] = times
+            events["arrival_time"] = times + travel_time
+        elif align == "arrival":
+            events["spawn_time"] = times - travel_time
+            events["arrival_time"] = times
+        else:
+            raise ValueError(f"unknown align: {align}")
+        events = events[np.argsort(events["spawn_time"], kind="stable")]
+    length = None if loop_beats is None else float(tempo_map.to_seconds(float(loop_beats)))
+    return EventTimeline(events, track_names, length)
+
+
+def compile_pattern(tracks, tempo, travel_time=0.0, align="spawn", loop=True):
+    """
+    ステップの並びのパターンをイベントの時刻表に変換する関数
+    tracks: {"hihat": [1, 0, ...], ...} または {"hihat": ([1, 0, ...], 1ステップの分解能), ...}
+            分解能は1拍あたりのステップ数 (省略すると1)
+    トラックごとに長さや分解能が違ってもよく、全トラックが揃う長さで繰り返す
+    """
+    track_names = list(tracks)
+    patterns = []
+    for name, pattern in tracks.items():
+        steps, resolution = pattern if isinstance(pattern, tuple) else (pattern, 1)
+        if len(steps) == 0:
+            raise ValueError(f"track {name!r} has no steps")
+        patterns.append((name, list(steps), Fraction(resolution)))
+
+    # 全トラックの長さ(拍)の最小公倍数を1周の長さにする
+    loop_beats = Fraction(0)
+    for _, steps, resolution in patterns:
+        length = Fraction(len(steps)) / resolution
+        loop_beats = length if loop_beats == 0 else _lcm(loop_beats, length)
+
+    notes = []
+    for name, steps, resolution in patterns:
+        repeats = int(loop_beats * resolution) // len(steps)
+        for i, on in enumerate(steps * repeats):
+            if on:
+                notes.append((Fraction(i) / resolution, name))
+    return compile_events(notes, track_names, tempo, travel_time, align, loop_beats if loop else None)
+
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_midi_drums(path, note_map=GM_DRUM_MAP, channel=9):
+    """
+    Standard MIDI Fileからドラムのノートとテンポ変化を読み込む関数
+    戻り値: ([(拍, トラック名), ...], [(拍, BPM), ...])
+    channel: ドラムのチャンネル (0始まり、General MIDIでは9)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError(f"{path} is not a Standard MIDI File")
+    header_length = struct.unpack(">I", data[4:8])[0]
+    _, track_count, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+
+    notes = []
+    tempo = []
+    pos = 8 + header_length
+    for _ in range(track_count):
+        chunk_type = data[pos:pos + 4]
+        chunk_length = struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        pos += 8
+        end = pos + chunk_length
+        if chunk_type != b"MTrk":
+            pos = end
+            continue
+        tick = 0
+        status = 0
+        while pos < end:
+            delta, pos = _read_varlen(data, pos)
+            tick += delta
+            if data[pos] & 0x80:
+                status = data[pos]
+                pos += 1
+            if status == 0xFF:
+                # メタイベント (0x51はテンポ)
+                meta_type = data[pos]
+                length, pos = _read_varlen(data, pos + 1)
+                if meta_type == 0x51:
+                    microseconds = int.from_bytes(data[pos:pos + 3], "big")
+                    tempo.append((Fraction(tick, division), 60_000_000 / microseconds))
+                pos += length
+            elif status in (0xF0, 0xF7):
+                length, pos = _read_varlen(data, pos)
+                pos += length
+            else:
+                kind = status & 0xF0
+                size = 1 if kind in (0xC0, 0xD0) else 2
+                message = data[pos:pos + size]
+                pos += size
+                if kind == 0x90 and (status & 0x0F) == channel and message[1] > 0 and message[0] in note_map:
+                    notes.append((Fraction(tick, division), note_map[message[0]]))
+        pos = end
+
+    if not tempo or tempo[0][0] > 0:
+        tempo.insert(0, (Fraction(0), 120.0))  # テンポの指定が無ければ120BPM
+    return sorted(notes), tempo
+
+
+def compile_midi(path, track_names, travel_time=0.0, align="arrival", note_map=GM_DRUM_MAP, channel=9):
+    """
+    MIDIファイルのドラムトラックをイベントの時刻表に変換する関数
+    track_namesに無いトラックのノートは無視する
+    """
+    notes, tempo = read_midi_drums(path, note_map, channel)
+    notes = [(beat, name) for beat, name in notes if name in track_names]
+    return compile_events(notes, track_names, tempo, travel_time, align)
+
+
+class EventTimeline:
+    """
+    時刻順に並んだイベントの配列と、どこまで読んだかのカーソルを持つクラス
+    length: 1周の秒数 (Noneなら繰り返さない)
+    """
+
+    def __init__(self, events, track_names, length=None):
+        self.events = events
+        self.track_names = list(track_names)
+        self.length = length
+        self.cursor = 0
+        self.loop = 0  # 何周目か
+
+    def reset(self):
+        self.cursor = 0
+        self.loop = 0
+
+    def next_time(self):
+        """
+        次のイベントの玉を出す時刻を返す関数 (もう無ければNone)
+        """
+        if self.cursor < len(self.events):
+            offset = self.loop * self.length if self.length else 0.0
+            return self.events["spawn_time"][self.cursor] + offset
+        if self.length and len(self.events):
+            return self.events["spawn_time"][0] + (self.loop + 1) * self.length
+        return None
+
+    def advance(self, time):
+        """
+        曲の先頭からtime秒までに玉を出すイベントを返し、カーソルを進める関数
+        戻り値の時刻は繰り返しの分を足した曲の先頭からの秒数になっている
+        """
+        chunks = []
+        while True:
+            offset = self.loop * self.length if self.length else 0.0
+            end = np.searchsorted(self.events["spawn_time"], time - offset, side="right")
+            if end > self.cursor:
+                chunk = self.events[self.cursor:end].copy()
+                chunk["spawn_time"] += offset
+                chunk["arrival_time"] += offset
+                chunks.append(chunk)
+                self.cursor = end
+            if self.cursor < len(self.events) or not self.length or len(self.events) == 0:
+                break
+            # 1周読み終えたら次の周へ
+            self.cursor = 0
+            self.loop += 1
+            if self.events["spawn_time"][0] + self.loop * self.length > time:
+                break
+        if not chunks:
+            return self.events[:0]
+        return np.concatenate(chunks)
@@ -0,0 +1,83 @@
+"""
+1台のカメラの前で2〜4人が遊ぶためのモジュール
+画面を横に等分したレーンに1人ずつ立つものとし、レーンごとに切り出した画像をまとめて推論する
+プレイヤーごとの当たりと得点は(人数, セグメント数)の配列で持つ
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import EMPTY_RESULTS, arrays_to_results, crop_to_frame, results_to_arrays
+
+
+def lane_boxes(width, height, players, overlap=0.1):
+    """
+    画面を横にplayers等分したレーンの範囲 (x0, y0, x1, y1) のリストを返す関数
+    overlap: 隣のレーンに食い込ませる幅 (レーンの幅に対する割合、境界に立った人を見失わないように)
+    """
+    lane = width / players
+    margin = lane * overlap
+    return [(int(max(0, i * lane - margin)), 0, int(min(width, (i + 1) * lane + margin)), height)
+            for i in range(players)]
+
+
+class MultiPlayerModel:
+    """
+    レーンごとの推論モデルを持ち、1フレームの全レーンをまとめて推論するクラス
+    フレーム全体をプレイヤーの数だけ推論するのではなく、レーンの切り出しだけを並列に推論する
+    戻り値はプレイヤーごとのResultsのリスト (座標はフレーム全体の正規化座標)
+
+    models: レーンごとの推論モデル (RoiModelなど、process(frame)を持つもの)
+    """
+
+    def __init__(self, models, overlap=0.1):
+        self.models = list(models)
+        self.overlap = overlap
+        self.executor = ThreadPoolExecutor(max_workers=len(self.models))
+
+    def _process_lane(self, model, frame, box):
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = box
+        results = model.process(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+        arrays = tuple(crop_to_frame(array, box, width, height) for array in results_to_arrays(results))
+        return arrays_to_results(arrays)
+
+    def process(self, frame):
+        height, width = frame.shape[:2]
+        boxes = lane_boxes(width, height, len(self.models), self.overlap)
+        # Mediapipeの推論中はGILが外れるので、レーンごとにスレッドで並列に動かす
+        futures = [self.executor.submit(self._process_lane, model, frame, box) for model, box in zip(self.models, boxes)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def split_results(results, players):
+    """
+    推論結果をプレイヤーごとのResultsのリストにそろえる関数 (1人用のモデルの結果も受け付ける)
+    """
+    if not isinstance(results, list):
+        results = [results]
+    return (results + [EMPTY_RESULTS] * players)[:players]
+
+
+class Scoreboard:
+    """
+    プレイヤーごとの当たっているセグメントと得点を管理するクラス
+    玉がリングを通過したときに、そのセグメントに当たっていたプレイヤーに1点を加える
+    """
+
+    def __init__(self, players, segments):
+        self.hits = np.zeros((players, segments), dtype=bool)
+        self.scores = np.zeros(players, dtype=np.int64)
+
+    def update(self, hits, crossed_segments):
+        """
+        hits: (人数, セグメント数)の今のフレームで当たっているセグメント
+        crossed_segments: このフレームで玉が通過したセグメントの番号の配列
+        """
+        self.hits = hits
+        counts = np.bincount(crossed_segments, minlength=hits.shape[1])
+        self.scores += hits @ counts
+        return self.scores
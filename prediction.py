@@ -0,0 +1,74 @@
+"""
+推論の遅れを隠すため、体の部位が少し先にどこにいるかを予測してリングの当たりを先取りするモジュール
+"""
+import numpy as np
+
+# セグメントごとの状態
+IDLE = 0  # 当たっていない
+PENDING = 1  # 予測で音を鳴らし、実際に当たるのを待っている
+ACTIVE = 2  # 当たっている (音は鳴らし済み)
+BLOCKED = 3  # 予測が外れて取り消した (予測が消えるまで再び鳴らさない)
+
+
+class PredictiveTrigger:
+    """
+    体の部位の位置と速度からhorizon秒先までの軌跡を予測し、軌跡がリングのセグメントに入ったら
+    実際に当たるより先に音を鳴らすクラス
+    予測から horizon + grace 秒経っても実際に当たらなければ、その音を取り消す
+
+    ring_index: ring.RingIndex
+    horizon: 予測する時間(秒) (latency.pyで計測した撮影から当たり判定までの遅延に合わせる)
+    grace: 予測が外れたと判断するまでの猶予(秒)
+    """
+
+    def __init__(self, ring_index, horizon=0.08, grace=0.05):
+        self.ring_index = ring_index
+        self.horizon = horizon
+        self.grace = grace
+        self.state = np.full(ring_index.segments, IDLE, dtype=np.int8)
+        self.deadline = np.zeros(ring_index.segments, dtype=np.float64)
+        self.fired = 0  # 予測で鳴らした回数
+        self.confirmed = 0  # 予測どおり当たった回数
+        self.cancelled = 0  # 予測が外れて取り消した回数
+
+    def update(self, points, velocity, valid, time, crossed=None):
+        """
+        今の位置と速度からセグメントの状態を更新する関数
+        points, velocity: (点の数, 2)のピクセル座標と速度(ピクセル/秒)
+        valid: (点の数,)の検出されたかどうか
+        crossed: (セグメント数,)の前のフレームから今までに通り抜けたセグメント (RingIndex.sweepの結果)
+        戻り値: (音を鳴らすセグメントの番号, 取り消すセグメントの番号)
+        """
+        points = np.asarray(points, dtype=np.float64)[valid]
+        velocity = np.asarray(velocity, dtype=np.float64)[valid]
+        occupied = self.ring_index.hits(points)
+        if crossed is not None:
+            occupied |= crossed
+        # 今からhorizon秒先までの直線の軌跡が通るセグメント
+        predicted, _, _ = self.ring_index.sweep(points, points + velocity * self.horizon)
+
+        state = self.state
+        idle = state == IDLE
+        pending = state == PENDING
+        # 実際に当たったか、予測で当たりそうなら鳴らす
+        fire = (idle | (state == BLOCKED)) & occupied
+        early = idle & predicted & ~occupied
+        # 予測どおり当たった / 期限までに当たらなかった
+        confirmed = pending & occupied
+        cancel = pending & ~occupied & (time > self.deadline)
+        # 当たりも予測も無くなったら次の当たりを受け付ける
+        released = ((state == ACTIVE) | (state == BLOCKED)) & ~occupied & ~predicted
+
+        state[fire | confirmed] = ACTIVE
+        state[early] = PENDING
+        self.deadline[early] = time + self.horizon + self.grace
+        state[cancel] = BLOCKED
+        state[released] = IDLE
+
+        self.fired += int(np.count_nonzero(early))
+        self.confirmed += int(np.count_nonzero(confirmed))
+        self.cancelled += int(np.count_nonzero(cancel))
+        return np.flatnonzero(fire | early), np.flatnonzero(cancel)
+
+    def stats(self):
+        return {"fired": self.fired, "confirmed": self.confirmed, "cancelled": self.cancelled}
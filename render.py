@@ -0,0 +1,114 @@
+"""
+録画した動画からゲームの1セッションを、ウィンドウを出さずに実時間より速く
+動画(MP4)と音声(WAV)に書き出すスクリプト
+beatles_011と同じ玉・リング・当たり判定の処理を使い、同じシードなら同じ結果になる
+
+使い方: python render.py input.mp4 output.mp4 output.wav --seed 0
+"""
+import argparse
+import os
+import random
+import wave
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")  # 音声デバイスが無くてもミキサーを初期化できるようにする
+
+import cv2
+import numpy as np
+import pygame
+
+import beatles_011
+from audio import SampleBank
+from bench import NullSound
+
+
+class OfflineClock:
+    """
+    フレームを書き出すごとに1/fps秒だけ進む時計
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.frame = 0
+
+    def __call__(self):
+        return self.frame / self.fps
+
+    def tick(self):
+        self.frame += 1
+
+
+class AudioMixer:
+    """
+    記録した発音の時刻にサンプルを足し合わせてWAVに書き出すクラス
+    """
+
+    def __init__(self, sample_files):
+        pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        self.frequency, _, self.channels = pygame.mixer.get_init()
+        bank = SampleBank()
+        self.samples = [np.frombuffer(bank.load(path).get_raw(), dtype=np.int16).reshape(-1, self.channels)
+                        for path in sample_files]
+        self.hits = []  # (トラック番号, 時刻)
+
+    def record(self, track, time):
+        self.hits.append((track, time))
+
+    def write(self, path, duration):
+        length = int(round(duration * self.frequency))
+        mix = np.zeros((length, self.channels), dtype=np.int32)
+        for track, time in self.hits:
+            start = int(round(time * self.frequency))
+            if start >= length:
+                continue
+            sample = self.samples[track][:length - start]
+            mix[start:start + len(sample)] += sample
+        mix = np.clip(mix, -32768, 32767).astype("<i2")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(self.channels)
+            f.setsampwidth(2)
+            f.setframerate(self.frequency)
+            f.writeframes(mix.tobytes())
+
+
+def render(video_path, output_video, output_audio, seed=0, fps=None, midi_file=None, holistic=None):
+    random.seed(seed)
+    cap = cv2.VideoCapture(video_path)
+    fps = fps or cap.get(cv2.CAP_PROP_FPS) or beatles_011.frame_rate
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(output_video, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    clock = OfflineClock(fps)
+    mixer = AudioMixer([beatles_011.hihat_sound_file, beatles_011.snare_sound_file, beatles_011.kick_sound_file])
+
+    def write_frame(frame):
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        clock.tick()
+        return True
+
+    try:
+        beatles_011.run(cap, display=write_frame, load_sound=lambda path: NullSound(), holistic=holistic,
+                        timeline=beatles_011.create_timeline(midi_file), clock=clock, realtime=False,
+                        on_sound=mixer.record)
+    finally:
+        cap.release()
+        writer.release()
+    mixer.write(output_audio, clock())
+    return clock.frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline render to video and audio files")
+    parser.add_argument("video", help="入力する動画ファイル")
+    parser.add_argument("output_video", help="書き出す動画ファイル (.mp4)")
+    parser.add_argument("output_audio", help="書き出す音声ファイル (.wav)")
+    parser.add_argument("--seed", type=int, default=0, help="Ballの向きを決める乱数のシード")
+    parser.add_argument("--fps", type=float, default=None, help="動画のフレームレート (省略すると入力と同じ)")
+    parser.add_argument("--midi", default=None, help="玉のパターンに使うMIDIファイル")
+    args = parser.parse_args()
+
+    frames = render(args.video, args.output_video, args.output_audio, args.seed, args.fps, args.midi)
+    print(f"{frames} frames written")
+
+
+if __name__ == "__main__":
+    main()
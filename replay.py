@@ -0,0 +1,230 @@
+"""
+フレームごとのランドマーク(姿勢・両手・visibility)と時刻をバイナリファイルに記録し、再生するモジュール
+ファイルはNumPyの構造化配列の.npyで、メモリマップで読み込める
+記録の設定(フレームの大きさ、乱数のシードなど)は同じ名前の.jsonに書く
+
+再生するときは推論を行わないので、描画・音・当たり判定だけを実時間よりはるかに速く動かせる
+使い方: python replay.py session.npy
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+
+from inference import LandmarkArray, Results, landmarks_to_array
+from landmarks import LEFT_HAND_OFFSET, NUM_LANDMARKS, POSE_OFFSET, RIGHT_HAND_OFFSET
+
+# 1フレーム分の記録
+# frame_time: そのフレームで玉を進めた時刻、capture_time: 撮影した時刻
+# results_id, results_time: そのフレームで使った推論結果のフレーム番号と、そのフレームの撮影時刻
+#   (別プロセスで推論すると同じ結果が何フレームか続くので、再生でも同じフレームだけ平滑化や当たり判定を進める)
+# landmarks: landmarks.pyと同じ並びの(x, y, z, visibility)、present: 姿勢・左手・右手が検出されたか
+LANDMARK_DTYPE = np.dtype([
+    ("frame_time", np.float64),
+    ("capture_time", np.float64),
+    ("results_id", np.int64),
+    ("results_time", np.float64),
+    ("present", np.bool_, (3,)),
+    ("landmarks", np.float32, (NUM_LANDMARKS, 4)),
+])
+
+# 姿勢・左手・右手の位置と点の数
+PARTS = [(POSE_OFFSET, 33), (LEFT_HAND_OFFSET, 21), (RIGHT_HAND_OFFSET, 21)]
+
+# .npyのヘッダの大きさ (記録の数を後から書き換えても長さが変わらないように固定する)
+HEADER_SIZE = 1024
+
+
+def _header(count):
+    header = {"descr": np.lib.format.dtype_to_descr(LANDMARK_DTYPE), "fortran_order": False, "shape": (count,)}
+    text = repr(header).encode("latin1")
+    prefix = np.lib.format.magic(1, 0)
+    length = HEADER_SIZE - len(prefix) - 2
+    return prefix + length.to_bytes(2, "little") + text.ljust(length - 1) + b"\n"
+
+
+def metadata_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+class LandmarkRecorder:
+    """
+    フレームごとのランドマークを.npyファイルに追記していくクラス
+    記録の数はclose()でヘッダに書き込む (途中で落ちても、それまでの記録はread_landmarksで読める)
+
+    metadata: 再生に必要な設定 (width, height, seedなど)
+    """
+
+    def __init__(self, path, **metadata):
+        self.path = path
+        self.metadata = metadata
+        self.count = 0
+        self.record = np.zeros((), dtype=LANDMARK_DTYPE)
+        self._write_metadata()
+        self.file = open(path, "wb")
+        self.file.write(_header(0))
+
+    def _write_metadata(self):
+        with open(metadata_path(self.path), "w") as f:
+            json.dump(self.metadata, f, indent=2)
+
+    def start(self, start_time):
+        """
+        ゲームループを始めた時刻を記録する関数 (再生するときの時計の始まり)
+        """
+        self.metadata["start_time"] = start_time
+        self._write_metadata()
+
+    def write(self, frame_time, capture_time, results, results_id, results_time):
+        record = self.record
+        record["frame_time"] = frame_time
+        record["capture_time"] = capture_time
+        record["results_id"] = results_id
+        record["results_time"] = results_time
+        parts = [results.pose_landmarks, results.left_hand_landmarks, results.right_hand_landmarks]
+        for i, ((offset, count), landmarks) in enumerate(zip(PARTS, parts)):
+            array = landmarks_to_array(landmarks)
+            record["present"][i] = array is not None
+            record["landmarks"][offset:offset + count] = 0 if array is None else array[:count]
+        self.file.write(record.tobytes())
+        self.count += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(_header(self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_landmarks(path):
+    """
+    記録をメモリマップで読み込み、(メタデータ, 構造化配列)を返す関数
+    ヘッダの記録数ではなくファイルの大きさから数を求めるので、閉じられなかったファイルも読める
+    """
+    with open(path, "rb") as f:
+        np.lib.format.read_magic(f)
+        _, _, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+    if dtype != LANDMARK_DTYPE:
+        raise ValueError(f"{path} is not a landmark recording of this version")
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    with open(metadata_path(path)) as f:
+        metadata = json.load(f)
+    return metadata, records
+
+
+class LandmarkReplay:
+    """
+    記録を再生するクラス
+    run()のcap(真っ黒なフレームを返す)、holistic(記録したランドマークを返す)、clock(記録した時刻)を兼ねる
+    results_id, results_timeで記録したときの推論結果のフレーム番号と撮影時刻を返し、run()を記録と同じ流れで動かす
+    """
+
+    def __init__(self, path):
+        self.metadata, self.records = read_landmarks(path)
+        self.width = self.metadata["width"]
+        self.height = self.metadata["height"]
+        self.frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.index = -1  # 最後に読み込んだフレームの番号
+        self.now = self.metadata.get("start_time", self.records["frame_time"][0] if len(self.records) else 0.0)
+
+    def isOpened(self):
+        return self.index + 1 < len(self.records)
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        self.index += 1
+        # 次のフレームで玉を進める時刻まで時計を進める
+        if self.index + 1 < len(self.records):
+            self.now = float(self.records["frame_time"][self.index + 1])
+        return True, self.frame
+
+    @property
+    def timestamp(self):
+        return float(self.records["capture_time"][self.index]) if self.index >= 0 else None
+
+    @property
+    def results_id(self):
+        return int(self.records["results_id"][self.index])
+
+    @property
+    def results_time(self):
+        return float(self.records["results_time"][self.index])
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.records)
+        return 0
+
+    def release(self):
+        pass
+
+    def process(self, frame):
+        record = self.records[self.index]
+        landmarks = record["landmarks"]
+        parts = [LandmarkArray(np.array(landmarks[offset:offset + count])) if present else None
+                 for (offset, count), present in zip(PARTS, record["present"])]
+        pose, left_hand, right_hand = parts
+        return Results(left_hand, right_hand, pose)
+
+    def close(self):
+        pass
+
+    def __call__(self):
+        return self.now
+
+
+def replay(path, display=None, seed=None):
+    """
+    記録からゲームを動かし、(フレーム数, 秒数, StageTimer)を返す関数
+    seedを省略すると記録したときのシードを使う
+    """
+    import beatles_011
+    from bench import NullSound, null_display
+
+    source = LandmarkReplay(path)
+    random.seed(source.metadata.get("seed") if seed is None else seed)
+    start = time.perf_counter()
+    timeline = beatles_011.create_timeline(source.metadata.get("midi_file"))
+    timer = beatles_011.run(source, display=display or null_display, load_sound=lambda path: NullSound(),
+                            holistic=source, timeline=timeline, clock=source, realtime=False)
+    return source.index + 1, time.perf_counter() - start, timer
+
+
+def main():
+    from bench import format_table
+
+    parser = argparse.ArgumentParser(description="replay a landmark recording")
+    parser.add_argument("recording", help="記録したランドマークのファイル (.npy)")
+    parser.add_argument("--seed", type=int, default=None, help="Ballの向きを決める乱数のシード (省略すると記録のまま)")
+    parser.add_argument("--show", action="store_true", help="ウィンドウに表示する")
+    args = parser.parse_args()
+
+    display = None
+    if args.show:
+        import beatles_011
+        display = beatles_011.show_frame
+    frames, elapsed, timer = replay(args.recording, display, args.seed)
+    print(f"{frames} frames in {elapsed:.2f} s ({frames / elapsed:.0f} fps)")
+    print(format_table(timer.percentiles()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import cv2
+import numpy as np
+
+# リングの色 (RGB画像に描画する)
+LIT_COLOR = (200, 0, 0)
+UNLIT_COLOR = (0, 0, 200)
+
+
+def segment_angles(i, segments=16):
+    """
+    i番目のセグメントの開始角度と終了角度(ラジアン)を返す関数
+    """
+    step = 2 * np.pi / segments
+    angle_start = i * step + step / 2  # 開始角度
+    angle_end = (i + 1) * step + step / 2  # 終了角度
+    return angle_start, angle_end
+
+
+def segment_position(dx, dy, segments=16):
+    """
+    中心からの位置(dx, dy)の、セグメント番号を単位にした角度の位置を返す関数 (整数部がセグメント番号)
+    角度はcv2.ellipseと同じく画像の+x方向から時計回り (yが下向き) に測る
+    """
+    step = 2 * np.pi / segments
+    angle = np.mod(np.arctan2(dy, dx), 2 * np.pi)
+    return np.mod((angle - step / 2) / step, segments)
+
+
+class RingIndex:
+    """
+    座標からリングのセグメント番号(外れていれば-1)を引く表を起動時に一度だけ作るクラス
+    毎フレームは点の数に関係なく、一回の配列の参照で当たったセグメントが分かる
+
+    cell: 表の1マスの大きさ(ピクセル)。大きくすると表が小さくなる代わりに境界が粗くなる
+    """
+
+    def __init__(self, center, radius, thickness, segments=16, cell=1):
+        self.segments = segments
+        self.cell = cell
+        self.center = center
+        self.inner = radius - thickness  # 当たりになる帯の内側と外側の半径
+        self.outer = radius + thickness
+        # リングの外接矩形だけを表にする (画面外にはみ出す部分も含む)
+        outer = radius + thickness
+        self.origin = (center[0] - outer, center[1] - outer)
+        size = (2 * outer) // cell + 1
+        ys, xs = np.mgrid[0:size, 0:size]
+        x = self.origin[0] + xs * cell + (cell - 1) / 2
+        y = self.origin[1] + ys * cell + (cell - 1) / 2
+
+        distance = np.sqrt((x - center[0])**2 + (y - center[1])**2)
+        inside = (self.inner <= distance) & (distance <= self.outer)
+
+        self.table = np.full((size, size), -1, dtype=np.int8)
+        position = segment_position(x - center[0], y - center[1], segments)
+        self.table[inside] = np.floor(position[inside]).astype(np.int8) % segments
+
+    def lookup(self, points):
+        """
+        (N, 2)のピクセル座標それぞれのセグメント番号を返す関数
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        col = np.floor((points[:, 0] - self.origin[0]) / self.cell).astype(np.intp)
+        row = np.floor((points[:, 1] - self.origin[1]) / self.cell).astype(np.intp)
+        size = self.table.shape[0]
+        ok = (0 <= col) & (col < size) & (0 <= row) & (row < size)
+        ids = np.full(len(points), -1, dtype=np.int8)
+        ids[ok] = self.table[row[ok], col[ok]]
+        return ids
+
+    def hits(self, points):
+        """
+        いずれかの点が入っているセグメントをbool配列で返す関数
+        """
+        ids = self.lookup(points)
+        hits = np.zeros(self.segments, dtype=bool)
+        hits[ids[ids >= 0]] = True
+        return hits
+
+    def sweep(self, start, end, start_time=0.0, end_time=1.0):
+        """
+        各点がstartからendまで直線で動いたときに、通り抜けたセグメントとリングに入った時刻を求める関数
+        フレームの間に帯を飛び越えるような速い動きも取りこぼさない
+        start, end: (N, 2)の前のフレームと今のフレームのピクセル座標
+        戻り値: (セグメント数,)のいずれかの点が通ったセグメントのbool配列,
+               (N,)の帯に入った時刻 (start_timeとend_timeの間を補間、入らなければnan),
+               (N,)の帯に入ったセグメント番号 (入らなければ-1)
+        """
+        point_hits, times, segment = self.sweep_points(start, end, start_time, end_time)
+        return point_hits.any(axis=0), times, segment
+
+    def sweep_points(self, start, end, start_time=0.0, end_time=1.0):
+        """
+        sweepと同じだが、通ったセグメントを点ごとの(N, セグメント数)のbool配列で返す関数
+        """
+        start = np.asarray(start, dtype=np.float64).reshape(-1, 2)
+        end = np.asarray(end, dtype=np.float64).reshape(-1, 2)
+        p = start - self.center
+        d = end - start
+        # |p + t d| = r を解き、帯の中にいるtの区間を求める (区間は内側の円で最大2つに分かれる)
+        a = (d * d).sum(axis=1)
+        b = 2 * (p * d).sum(axis=1)
+        c = (p * p).sum(axis=1)
+        outer_in, outer_out = _circle_interval(a, b, c - self.outer**2)
+        inner_in, inner_out = _circle_interval(a, b, c - self.inner**2)
+        low = np.maximum(outer_in, 0.0)
+        high = np.minimum(outer_out, 1.0)
+        # 内側の円に入らない点は区間が分かれない
+        no_inner = ~(inner_in < inner_out)
+        inner_in[no_inner] = np.inf
+        inner_out[no_inner] = np.inf
+        intervals = np.stack([
+            np.stack([low, np.minimum(high, inner_in)], axis=1),
+            np.stack([np.maximum(low, inner_out), high], axis=1),
+        ], axis=1)  # (N, 2, 2) 区間ごとの (入ったt, 出たt)
+        valid = intervals[:, :, 0] <= intervals[:, :, 1]
+
+        # 区間の両端のセグメント上の位置 (直線上の点の角度は単調に変わるので、間のセグメントを全て通る)
+        ts = np.where(valid[:, :, None], intervals, 0.0)
+        points = p[:, None, None] + d[:, None, None] * ts[:, :, :, None]
+        position = segment_position(points[..., 0], points[..., 1], self.segments)
+        first = position[:, :, 0]
+        delta = np.mod(position[:, :, 1] - first + self.segments / 2, self.segments) - self.segments / 2
+        lowest = np.floor(first + np.minimum(delta, 0))
+        count = np.floor(first + np.maximum(delta, 0)) - lowest  # 通ったセグメントの数 - 1
+        offsets = np.arange(self.segments)
+        crossed = valid[:, :, None] & (offsets <= count[:, :, None])
+        ids = np.mod(lowest[:, :, None] + offsets, self.segments).astype(np.intp)
+        rows = np.arange(len(start))
+        hits = np.zeros((len(start), self.segments), dtype=bool)
+        hits[np.broadcast_to(rows[:, None, None], ids.shape)[crossed], ids[crossed]] = True
+
+        # 最初に帯に入った時刻とセグメント
+        entered = valid.any(axis=1)
+        k = np.where(valid[:, 0], 0, 1)
+        t = np.where(entered, intervals[rows, k, 0], 0.0)  # 入らなかった点はinfなので0にしておく
+        times = np.where(entered, start_time + t * (end_time - start_time), np.nan)
+        segment = np.where(entered, np.floor(position[rows, k, 0]).astype(np.int64) % self.segments, -1)
+        return hits, times, segment.astype(np.int8)
+
+    def bitmask(self, points):
+        """
+        当たったセグメントをビットで表した整数を返す関数
+        """
+        ids = self.lookup(points)
+        return int(np.bitwise_or.reduce(np.left_shift(1, ids[ids >= 0].astype(np.int64)), initial=0))
+
+
+def _circle_interval(a, b, c):
+    """
+    a t^2 + b t + c <= 0 となるtの区間(円の中にいる区間)を返す関数 (無ければ入る時刻 > 出る時刻)
+    動いていない点(a == 0)は、円の中にいれば全ての時刻、外にいれば空の区間にする
+    """
+    moving = a > 0
+    safe_a = np.where(moving, a, 1.0)
+    discriminant = b * b - 4 * safe_a * c
+    root = np.sqrt(np.maximum(discriminant, 0.0))
+    t_in = np.where(discriminant >= 0, (-b - root) / (2 * safe_a), np.inf)
+    t_out = np.where(discriminant >= 0, (-b + root) / (2 * safe_a), -np.inf)
+    t_in = np.where(moving, t_in, np.where(c <= 0, -np.inf, np.inf))
+    t_out = np.where(moving, t_out, np.where(c <= 0, np.inf, -np.inf))
+    return t_in, t_out
+
+
+class RingCompositor:
+    """
+    リングの各セグメントを起動時に一度だけ描画しておき、
+    毎フレームは当たり判定の状態に合わせて一回だけ合成するクラス
+    """
+
+    def __init__(self, shape, center, radius, thickness, segments=16, alpha=0.5,
+                 lit_color=LIT_COLOR, unlit_color=UNLIT_COLOR):
+        height, width = shape[:2]
+        self.segments = segments
+        self.lit_color = np.array(lit_color, dtype=np.float32)
+        self.unlit_color = np.array(unlit_color, dtype=np.float32)
+
+        # セグメントごとのマスクを作成 (元の描画と同じcv2.ellipseの引数を使う)
+        masks = []
+        for i in range(segments):
+            angle_start, angle_end = segment_angles(i, segments)
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.ellipse(mask, center, (radius, radius), 0, int(angle_start * 180 / np.pi), int(angle_end * 180 / np.pi), 255, thickness)
+            masks.append(mask.reshape(-1) > 0)
+
+        # リングに掛かる画素だけを保持する
+        union = np.logical_or.reduce(masks)
+        self.indices = np.flatnonzero(union)
+        covered = np.stack([mask[self.indices] for mask in masks], axis=1)
+
+        # セグメントを順番にaddWeightedした場合の各画素の重みを求める
+        # 後から重なったセグメントほど前の色を(1 - alpha)倍で薄めていく
+        n = len(self.indices)
+        self.base_weight = np.ones(n, dtype=np.float32)
+        self.weights = np.zeros((n, segments), dtype=np.float32)
+        for i in range(segments):
+            inside = covered[:, i]
+            self.base_weight[inside] *= 1 - alpha
+            self.weights[inside] *= 1 - alpha
+            self.weights[inside, i] = alpha
+
+        self._cache = {}
+
+    def _overlay(self, hits):
+        # 当たり状態ごとの色の寄与を計算してキャッシュする
+        key = sum(1 << i for i, hit in enumerate(hits) if hit)
+        overlay = self._cache.get(key)
+        if overlay is None:
+            lit = np.array(hits, dtype=bool)[:, None]
+            colors = np.where(lit, self.lit_color, self.unlit_color)
+            overlay = self.weights @ colors
+            if len(self._cache) >= 64:
+                self._cache.clear()
+            self._cache[key] = overlay
+        return overlay
+
+    def composite(self, frame, hits):
+        """
+        フレームにリングを合成する関数 (frameを直接書き換える)
+        """
+        flat = frame.reshape(-1, frame.shape[2])
+        pixels = flat[self.indices].astype(np.float32)
+        blended = pixels * self.base_weight[:, None] + self._overlay(hits)
+        flat[self.indices] = np.rint(blended).astype(np.uint8)
+        return frame
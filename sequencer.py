@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
+# シーケンサのスレッドが動いている間のGILの切り替え間隔(秒)
+# ゲームループがPythonのコードを実行していても、起きたシーケンサのスレッドがこれ以上待たされないようにする
+# (既定の5ミリ秒だと、音の時刻が最大5ミリ秒遅れる)
+SWITCH_INTERVAL = 0.001
+
+
+class StepSequencer:
+    """
+    コンパイル済みのイベントの時刻表(patterns.EventTimeline)を一つの曲の時計(time.monotonic)で読み進め、
+    専用のスレッドでイベントの時刻ちょうどにon_eventsを呼ぶクラス
+    玉がリングに着く時刻(arrival_time)も同じスレッドで待ち、その時刻ちょうどにon_arrivalを呼ぶ
+    フレームレートに関係なく、イベントと音は決まった時刻に処理される
+
+    on_events: on_events(イベントの配列) 時刻はclock()と同じ基準の絶対時刻に直して渡す
+    on_arrival: on_arrival(トラック番号, リングに着く時刻) 音を鳴らす関数 (Noneなら呼ばない)
+    threaded=Falseで始めた場合はスレッドを使わず、呼び出し側がpoll()で進める (オフライン描画用)
+    """
+
+    def __init__(self, timeline, on_events, clock=time.monotonic, on_arrival=None):
+        self.timeline = timeline
+        self.on_events = on_events
+        self.on_arrival = on_arrival
+        self.clock = clock
+        self.arrivals = []  # (リングに着く時刻, 順番, トラック番号) の優先度付きキュー
+        self._order = itertools.count()
+        self._switch_interval = None  # 変更する前のGILの切り替え間隔
+        self.start_time = None
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self, start_time=None, threaded=True):
+        self.start_time = self.clock() if start_time is None else start_time
+        if threaded:
+            self._switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(self._switch_interval, SWITCH_INTERVAL))
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def poll(self):
+        """
+        今の時刻までのイベントをon_eventsに渡し、リングに着く時刻になった音をon_arrivalで鳴らす関数
+        """
+        now = self.clock()
+        events = self.timeline.advance(now - self.start_time)
+        if len(events):
+            events["spawn_time"] += self.start_time
+            events["arrival_time"] += self.start_time
+            if self.on_arrival is not None:
+                for arrival_time, track in zip(events["arrival_time"].tolist(), events["track"].tolist()):
+                    heapq.heappush(self.arrivals, (arrival_time, next(self._order), track))
+            self.on_events(events)
+        while self.arrivals and self.arrivals[0][0] <= now:
+            arrival_time, _, track = heapq.heappop(self.arrivals)
+            self.on_arrival(track, arrival_time)
+
+    def next_time(self):
+        """
+        次にイベントを出すか音を鳴らす時刻 (clock()と同じ基準、無ければNone)
+        """
+        times = []
+        next_event = self.timeline.next_time()
+        if next_event is not None:
+            times.append(self.start_time + next_event)
+        if self.arrivals:
+            times.append(self.arrivals[0][0])
+        return min(times) if times else None
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self._switch_interval is not None:
+            sys.setswitchinterval(self._switch_interval)
+            self._switch_interval = None
+
+    def _wait_until(self, target):
+        # 直前まではスリープし、最後の数ミリ秒だけ細かく待つ
+        while not self._stop.is_set():
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return True
+            if remaining > 0.002:
+                self._stop.wait(remaining - 0.002)
+            else:
+                time.sleep(0)
+        return False
+
+    def _run(self):
+        _raise_thread_priority()
+        while True:
+            next_time = self.next_time()
+            if next_time is None or not self._wait_until(next_time):
+                break
+            self.poll()
+
+
+def _raise_thread_priority():
+    # Linuxではスレッドごとにnice値を下げられる (権限が無ければそのまま)
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -10)
+    except (AttributeError, OSError):
+        pass
@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+
+
+class OneEuroFilter:
+    """
+    複数の点の座標のぶれをまとめて抑えるOne Euroフィルタ
+    ゆっくり動いているときは強く平滑化し、速く動いているときは遅れが出ないように弱める
+    平滑化した速度(1秒あたりの移動量)も求める
+
+    count: 点の数
+    min_cutoff: 止まっているときのカットオフ周波数 (Hz、小さいほどぶれが減るが遅れる)
+    beta: 速さに応じてカットオフ周波数を上げる係数 (大きいほど速い動きに遅れずについていく)
+    d_cutoff: 速度を平滑化するカットオフ周波数 (Hz)
+    """
+
+    def __init__(self, count, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, dims=2):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = np.zeros((count, dims), dtype=np.float64)  # 平滑化した座標
+        self.velocity = np.zeros((count, dims), dtype=np.float64)  # 平滑化した速度
+        self.raw = np.zeros((count, dims), dtype=np.float64)  # 前回の平滑化する前の座標
+        self.initialized = np.zeros(count, dtype=bool)  # 前回も検出されていた点
+        self.time = None
+
+    def reset(self, mask=None):
+        """
+        フィルタをやり直す関数 (maskを渡すとその点だけを次の座標からやり直す)
+        """
+        if mask is not None:
+            self.initialized[mask] = False
+            self.velocity[mask] = 0
+            return
+        self.initialized[:] = False
+        self.velocity[:] = 0
+        self.time = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    def update(self, points, valid, time):
+        """
+        時刻time(秒)の座標を取り込み、平滑化した座標を返す関数
+        points: (点の数, dims)の座標
+        valid: (点の数,)の検出されたかどうか (検出されなかった点は前の値のまま)
+        途切れてから再び検出された点は、その座標からやり直す
+        """
+        points = np.asarray(points, dtype=np.float64)
+        valid = np.asarray(valid, dtype=bool)
+        dt = None if self.time is None else time - self.time
+        if dt is not None and dt <= 0:
+            # 同じ時刻のフレームは平滑化しない
+            return self.value
+        self.time = time
+
+        start = valid & ~self.initialized
+        self.value[start] = points[start]
+        self.velocity[start] = 0
+        update = valid & self.initialized
+        if dt is not None and update.any():
+            # 平滑化した座標は遅れているので、速度は平滑化する前の座標の差から求める
+            raw_velocity = (points[update] - self.raw[update]) / dt
+            velocity = self.velocity[update]
+            velocity += self._alpha(self.d_cutoff, dt) * (raw_velocity - velocity)
+            speed = np.linalg.norm(velocity, axis=1, keepdims=True)
+            cutoff = self.min_cutoff + self.beta * speed
+            self.value[update] += self._alpha(cutoff, dt) * (points[update] - self.value[update])
+            self.velocity[update] = velocity
+        self.velocity[~valid] = 0
+        self.raw[valid] = points[valid]
+        self.initialized = valid.copy()
+        return self.value
@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# ヒストグラムの区間の境界(ミリ秒)
+HISTOGRAM_EDGES_MS = [0, 1, 2, 4, 8, 16, 33, 50, 100, 200, float("inf")]
+
+
+class StageTimer:
+    """
+    ゲームループの各処理(キャプチャ、推論など)にかかった時間を記録するクラス
+    玉の数などの処理時間以外の値もrecord()で一緒に記録できる
+    maxlenを指定すると直近の件数だけを残す
+    """
+
+    def __init__(self, maxlen=None):
+        self.samples = defaultdict(lambda: deque(maxlen=maxlen))
+        self.values = defaultdict(lambda: deque(maxlen=maxlen))
+        self.last_tick = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+    def tick(self):
+        """
+        1フレームごとに呼び、前回からの間隔を"frame"として記録する関数
+        """
+        now = time.perf_counter()
+        if self.last_tick is not None:
+            self.samples["frame"].append(now - self.last_tick)
+        self.last_tick = now
+
+    def record(self, name, value):
+        self.values[name].append(value)
+
+    def last(self, name):
+        """
+        処理の直近の時間(ミリ秒)を返す関数 (まだ無ければNone)
+        """
+        samples = self.samples.get(name)
+        return samples[-1] * 1000 if samples else None
+
+    def fps(self):
+        """
+        直近のフレーム間隔の平均から求めたフレームレート
+        """
+        samples = self.samples.get("frame")
+        if not samples:
+            return 0.0
+        return len(samples) / sum(samples)
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """
+        処理ごとのパーセンタイル(ミリ秒)を返す関数
+        """
+        stats = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.percentile(np.fromiter(samples, dtype=np.float64), qs) * 1000
+            stats[name] = {f"p{q}": float(v) for q, v in zip(qs, values)}
+            stats[name]["count"] = len(samples)
+        return stats
+
+    def histogram(self, edges_ms=HISTOGRAM_EDGES_MS):
+        """
+        処理ごとに、時間(ミリ秒)がedges_msの各区間に入った回数を返す関数
+        """
+        return {name: np.histogram(np.fromiter(samples, dtype=np.float64) * 1000, edges_ms)[0].tolist()
+                for name, samples in self.samples.items() if samples}
+
+    def value_stats(self, qs=(50, 95, 99)):
+        """
+        record()で記録した値ごとの平均、最大値とパーセンタイルを返す関数
+        """
+        stats = {}
+        for name, values in self.values.items():
+            if not values:
+                continue
+            values = np.fromiter(values, dtype=np.float64)
+            stats[name] = {f"p{q}": float(v) for q, v in zip(qs, np.percentile(values, qs))}
+            stats[name].update(mean=float(values.mean()), max=float(values.max()), count=len(values))
+        return stats
+
+    def export(self, path):
+        """
+        記録した時間と値を、拡張子に応じてJSONかCSVで書き出す関数
+        """
+        edges = HISTOGRAM_EDGES_MS
+        stages = self.percentiles()
+        histogram = self.histogram(edges)
+        values = self.value_stats()
+        if os.path.splitext(path)[1].lower() == ".csv":
+            bins = [f"{low:g}-{high:g}ms" for low, high in zip(edges[:-1], edges[1:])]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name", "unit", "count", "mean", "p50", "p95", "p99", "max"] + bins)
+                for name, stats in stages.items():
+                    writer.writerow([name, "ms", stats["count"], "", stats["p50"], stats["p95"], stats["p99"], ""]
+                                    + histogram[name])
+                for name, stats in values.items():
+                    writer.writerow([name, "", stats["count"], stats["mean"], stats["p50"], stats["p95"],
+                                     stats["p99"], stats["max"]] + [""] * len(bins))
+        else:
+            with open(path, "w") as f:
+                json.dump({"stages_ms": stages, "values": values,
+                           "histogram": {"edges_ms": [e if e != float("inf") else None for e in edges],
+                                         "counts": histogram}}, f, indent=2)
+
+
+# 1フレームが通る区間の順番
+HOPS = ["capture", "landmarks", "hit", "display"]
+# 計測する遅延の名前
+LATENCIES = [f"{a}->{b}" for a, b in zip(HOPS, HOPS[1:])] + ["end_to_end", "crossing->dispatch", "hit->dispatch",
+                                                              "capture->dispatch", "dispatch->output"]
+
+
+class LatencyTracker:
+    """
+    体の動きが画面と音に反映されるまでの遅延を計測するクラス
+    フレーム番号ごとに撮影・ランドマーク取得・当たり判定・表示の時刻を記録し、区間ごとの遅延をtimerに溜める
+    別プロセスで推論する場合は、結果が届いたフレームの番号で記録する
+    音は玉がリングを通過した時刻から再生を要求するまで(crossing->dispatch)と、
+    出力デバイスから音が出るまで(dispatch->output)を記録する
+    体の動きでセグメントの音を鳴らした場合は、当たり判定から(hit->dispatch)と撮影から(capture->dispatch)を記録する
+    """
+
+    def __init__(self, timer=None, clock=time.monotonic):
+        self.timer = StageTimer(maxlen=1000) if timer is None else timer
+        self.clock = clock
+        self.frames = {}  # フレーム番号 -> {区間: 時刻}
+
+    def begin(self, frame_id, capture_time=None):
+        """
+        フレームを撮影した時刻を記録する関数 (capture_timeを省略すると今の時刻)
+        """
+        self.frames[frame_id] = {"capture": self.clock() if capture_time is None else capture_time}
+
+    def mark(self, frame_id, hop):
+        # 同じフレームの結果が何度使われても、最初に通過した時刻だけを記録する
+        stamps = self.frames.get(frame_id)
+        if stamps is not None and hop not in stamps:
+            stamps[hop] = self.clock()
+
+    def finish(self, frame_id):
+        """
+        フレームの記録を締めて、区間ごとの遅延を計算する関数
+        これより古いフレームの記録は(推論が追いつかずに)使われなかったものとして捨てる
+        """
+        stamps = self.frames.pop(frame_id, None)
+        for old in [i for i in self.frames if i < frame_id]:
+            del self.frames[old]
+        if stamps is None:
+            return
+        times = [(hop, stamps[hop]) for hop in HOPS if hop in stamps]
+        for (a, start), (b, end) in zip(times, times[1:]):
+            self.timer.samples[f"{a}->{b}"].append(end - start)
+        if len(times) > 1:
+            self.timer.samples["end_to_end"].append(times[-1][1] - times[0][1])
+
+    def dispatch(self, crossing_time):
+        """
+        玉がリングを通過した(シミュレーション上の)時刻から、再生を要求するまでの遅延を記録する関数
+        """
+        self.timer.samples["crossing->dispatch"].append(self.clock() - crossing_time)
+
+    def trigger(self, frame_id):
+        """
+        フレームの当たり判定でセグメントの音の再生を要求したときの遅延を記録する関数
+        (そのフレームの記録がもう締められていれば何もしない)
+        """
+        stamps = self.frames.get(frame_id)
+        if stamps is None or "hit" not in stamps:
+            return
+        now = self.clock()
+        self.timer.samples["hit->dispatch"].append(now - stamps["hit"])
+        self.timer.samples["capture->dispatch"].append(now - stamps["capture"])
+
+    def output(self, dispatch_time, output_time):
+        self.timer.samples["dispatch->output"].append(output_time - dispatch_time)
+
+    def report(self):
+        """
+        遅延ごとのパーセンタイル(ミリ秒)を返す関数
+        """
+        stats = self.timer.percentiles()
+        return {name: stats[name] for name in LATENCIES if name in stats}
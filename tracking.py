@@ -0,0 +1,162 @@
+import math
+
+import mediapipe as mp
+
+from inference import Results
+
+mp_pose = mp.solutions.pose
+mp_hands = mp.solutions.hands
+mp_holistic = mp.solutions.holistic
+
+# プロファイルごとに得られるランドマーク (軽い順)
+PROFILES = {
+    "hands": {"left_hand", "right_hand"},
+    "pose": {"pose"},
+    "pose_hands": {"pose", "left_hand", "right_hand"},
+    "holistic": {"pose", "left_hand", "right_hand", "face"},
+}
+
+
+def choose_profile(required):
+    """
+    必要なランドマークを全て得られる一番軽いプロファイルの名前を返す関数
+    """
+    for name, provided in PROFILES.items():
+        if set(required) <= provided:
+            return name
+    raise ValueError(f"unknown landmarks: {set(required) - PROFILES['holistic']}")
+
+
+class _Tracker:
+    # with文で使えるようにするための共通部分
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PoseTracker(_Tracker):
+    """
+    姿勢(pose)だけを検出するトラッカー
+    """
+
+    def __init__(self, model_complexity=1, **kwargs):
+        self.pose = mp_pose.Pose(model_complexity=model_complexity, **kwargs)
+
+    def process(self, frame):
+        return Results(None, None, self.pose.process(frame).pose_landmarks)
+
+    def close(self):
+        self.pose.close()
+
+
+class HandsTracker(_Tracker):
+    """
+    両手だけを検出するトラッカー
+    左右はHolisticと同じく姿勢の左右に合わせる
+    (入力は左右反転した画像なので、Handsの"Left"は本人の左手で、姿勢では右手になる)
+    """
+
+    def __init__(self, model_complexity=1, **kwargs):
+        # Handsのmodel_complexityは0か1
+        self.hands = mp_hands.Hands(max_num_hands=2, model_complexity=min(model_complexity, 1), **kwargs)
+
+    def detect(self, frame):
+        """
+        検出された手の(ランドマーク, Handsのラベル)のリストを返す関数
+        """
+        results = self.hands.process(frame)
+        return [(landmarks, handedness.classification[0].label)
+                for landmarks, handedness in zip(results.multi_hand_landmarks or [], results.multi_handedness or [])]
+
+    def split(self, hands):
+        """
+        detect()の結果を(左手, 右手)に分ける関数
+        同じラベルの手が二つあるときは、画像の右側にある方を左手にする (どちらも捨てない)
+        """
+        if len(hands) == 2 and hands[0][1] == hands[1][1]:
+            right_hand, left_hand = sorted((landmarks for landmarks, _ in hands), key=lambda hand: hand.landmark[0].x)
+            return left_hand, right_hand
+        left_hand, right_hand = None, None
+        for landmarks, label in hands:
+            if label == "Left":
+                right_hand = landmarks
+            else:
+                left_hand = landmarks
+        return left_hand, right_hand
+
+    def process(self, frame):
+        left_hand, right_hand = self.split(self.detect(frame))
+        return Results(left_hand, right_hand, None)
+
+    def close(self):
+        self.hands.close()
+
+
+def assign_hands(hands, wrists, scale=(1.0, 1.0)):
+    """
+    検出された手を、手首が近い方の姿勢の手首(左, 右)に割り当てる関数
+    hands: 手のランドマークのリスト (2つまで)
+    wrists: 姿勢の(左手首, 右手首)のランドマーク
+    scale: x, yに掛ける値 (フレームの幅と高さを渡すと縦横比の歪みが無くなる)
+    戻り値: (左手, 右手)
+    """
+    def distance(hand, wrist):
+        return math.hypot((hand.landmark[0].x - wrist.x) * scale[0], (hand.landmark[0].y - wrist.y) * scale[1])
+
+    left_wrist, right_wrist = wrists
+    if not hands:
+        return None, None
+    if len(hands) == 1:
+        hand = hands[0]
+        return (hand, None) if distance(hand, left_wrist) <= distance(hand, right_wrist) else (None, hand)
+    first, second = hands[:2]
+    straight = distance(first, left_wrist) + distance(second, right_wrist)
+    crossed = distance(first, right_wrist) + distance(second, left_wrist)
+    return (first, second) if straight <= crossed else (second, first)
+
+
+class PoseHandsTracker(_Tracker):
+    """
+    姿勢と両手を検出するトラッカー (Holisticと違い顔のランドマークは推論しない)
+    姿勢で手首が見えていないフレームでは手のモデルを動かさない
+    手の左右はHandsのラベルではなく、姿勢の手首に近い方で決める (姿勢の足などと左右がそろう)
+    """
+
+    def __init__(self, model_complexity=1, min_wrist_visibility=0.5, **kwargs):
+        self.pose = PoseTracker(model_complexity, **kwargs)
+        self.hands = HandsTracker(model_complexity, **kwargs)
+        self.min_wrist_visibility = min_wrist_visibility
+
+    def process(self, frame):
+        pose = self.pose.process(frame).pose_landmarks
+        if pose is None:
+            return Results(None, None, None)
+        wrists = [pose.landmark[mp_pose.PoseLandmark.LEFT_WRIST], pose.landmark[mp_pose.PoseLandmark.RIGHT_WRIST]]
+        if all(wrist.visibility < self.min_wrist_visibility for wrist in wrists):
+            return Results(None, None, pose)
+        hands = [landmarks for landmarks, _ in self.hands.detect(frame)]
+        left_hand, right_hand = assign_hands(hands, wrists, (frame.shape[1], frame.shape[0]))
+        return Results(left_hand, right_hand, pose)
+
+    def close(self):
+        self.pose.close()
+        self.hands.close()
+
+
+def create_tracker(required, model_complexity=1, **kwargs):
+    """
+    ゲームが必要とするランドマーク(required)を得られる一番軽いトラッカーを作る関数
+    required: {"pose", "left_hand", "right_hand", "face"} の部分集合
+    model_complexity: 0(軽い), 1, 2(精度が高い)
+    その他の引数(min_detection_confidenceなど)はMediapipeのモデルにそのまま渡す
+    """
+    profile = choose_profile(required)
+    if profile == "pose":
+        return PoseTracker(model_complexity, **kwargs)
+    if profile == "hands":
+        return HandsTracker(model_complexity, **kwargs)
+    if profile == "pose_hands":
+        return PoseHandsTracker(model_complexity, **kwargs)
+    return mp_holistic.Holistic(model_complexity=model_complexity, **kwargs)